@@ -2,8 +2,11 @@
 Accuracy Feedback Service for PDFTablePro
 Collects and manages user feedback on extraction accuracy for social proof
 """
-import json
 import os
+import time
+import asyncio
+import copy
+import orjson
 from datetime import datetime, timedelta
 from typing import Dict, Any, Optional
 from pathlib import Path
@@ -14,47 +17,212 @@ logger = logging.getLogger(__name__)
 class AccuracyFeedbackService:
     """Service for managing extraction accuracy feedback"""
     
+    # Entries used for recent and per-method statistics
+    max_entries = 1000
+    # Compact the entries log down to max_entries once it grows past this size
+    max_entries_file_bytes = 5 * 1024 * 1024
+    # Seconds a computed stats response may be served before the 30-day window is recomputed
+    stats_cache_ttl = 60
+    # Length of the "recent" accuracy window
+    recent_window_days = 30
+    # Layout version of the stats file; other versions are rebuilt from the entries log
+    schema_version = 2
+    
     def __init__(self):
-        self.feedback_file = Path("data/accuracy_feedback.json")
-        self.feedback_file.parent.mkdir(exist_ok=True)
+        data_dir = Path("data")
+        data_dir.mkdir(exist_ok=True)
+        # Append-only log of feedback entries, one JSON object per line
+        self.entries_file = data_dir / "accuracy_feedback_entries.jsonl"
+        # Aggregate counters, rewritten on each submission
+        self.stats_file = data_dir / "accuracy_feedback_stats.json"
+        # Legacy single-file store (counters plus entries), migrated on first start
+        self.feedback_file = data_dir / "accuracy_feedback.json"
+        
+        # Parsed entries and computed stats, reused while the files are unchanged
+        self._cached_entries = None
+        self._cached_entries_key = None
+        self._cached_stats = None
+        self._cached_stats_key = None
+        self._cached_stats_time = 0.0
+        self._lock = asyncio.Lock()
+        
         self.ensure_feedback_file_exists()
     
+    def _initial_stats(self) -> Dict[str, Any]:
+        """Counters for an empty feedback store"""
+        return {
+            "schema_version": self.schema_version,
+            "total_feedback": 0,
+            "accurate_count": 0,
+            "inaccurate_count": 0,
+            "accuracy_rate": 0.0,
+            "last_updated": datetime.now().isoformat(),
+            # Running per-method counters: {method: {"total": n, "accurate": n}}
+            "method_breakdown": {},
+            # [epoch_seconds, is_accurate, file_id] per submission inside the recent window
+            "recent_window": [],
+            # Latest [epoch_seconds, is_accurate, method] per file_id, for every file
+            # ever submitted, so a resubmission always replaces its earlier verdict
+            "file_index": {}
+        }
+    
     def ensure_feedback_file_exists(self):
-        """Initialize feedback file if it doesn't exist"""
-        if not self.feedback_file.exists():
-            initial_data = {
-                "total_feedback": 0,
-                "accurate_count": 0,
-                "inaccurate_count": 0,
-                "accuracy_rate": 0.0,
-                "last_updated": datetime.now().isoformat(),
-                "feedback_entries": []
-            }
-            self.save_feedback_data(initial_data)
+        """Initialize feedback files if they don't exist, migrating the legacy store"""
+        if self.stats_file.exists():
+            stats = self.load_stats()
+            if stats.get("schema_version") != self.schema_version:
+                # Counters written before the running aggregates existed, or before
+                # recent-window items named their file
+                stats.update(self._aggregate_entries(self.load_entries()))
+                stats["schema_version"] = self.schema_version
+                self.save_stats(stats)
+            return
+        
+        stats = self._initial_stats()
+        entries = []
+        if self.feedback_file.exists():
+            try:
+                with open(self.feedback_file, 'rb') as f:
+                    legacy = orjson.loads(f.read())
+                entries = legacy.pop("feedback_entries", [])
+                stats.update(legacy)
+                logger.info(f"Migrating {len(entries)} feedback entries from {self.feedback_file}")
+            except Exception as e:
+                logger.error(f"Error migrating legacy feedback data: {e}")
+        
+        stats.update(self._aggregate_entries(entries))
+        self._write_entries(entries)
+        self.save_stats(stats)
     
-    def load_feedback_data(self) -> Dict[str, Any]:
-        """Load feedback data from file"""
+    def _aggregate_entries(self, entries: list) -> Dict[str, Any]:
+        """Build the running aggregates from stored entries (migration only)"""
+        entries = self._latest_per_file(entries)
+        method_breakdown = {}
+        for entry in entries:
+            counts = method_breakdown.setdefault(entry.get("extraction_method", "unknown"),
+                                                 {"total": 0, "accurate": 0})
+            counts["total"] += 1
+            if entry.get("is_accurate", False):
+                counts["accurate"] += 1
+        
+        recent_window = [
+            [int(datetime.fromisoformat(entry["timestamp"]).timestamp()), bool(entry.get("is_accurate", False)),
+             entry.get("file_id")]
+            for entry in self._get_recent_feedback(entries, days=self.recent_window_days)
+        ]
+        
+        file_index = {}
+        for entry in entries:
+            try:
+                epoch = int(datetime.fromisoformat(entry["timestamp"]).timestamp())
+            except (KeyError, ValueError):
+                continue
+            file_index[entry.get("file_id")] = [epoch, bool(entry.get("is_accurate", False)),
+                                                entry.get("extraction_method", "unknown")]
+        
+        return {"method_breakdown": method_breakdown, "recent_window": recent_window,
+                "file_index": file_index}
+    
+    def _latest_per_file(self, entries: list) -> list:
+        """Entries with only the last submission kept for each file_id, in log order"""
+        seen = set()
+        latest = []
+        for entry in reversed(entries):
+            file_id = entry.get("file_id")
+            if file_id not in seen:
+                seen.add(file_id)
+                latest.append(entry)
+        latest.reverse()
+        return latest
+    
+    def load_stats(self) -> Dict[str, Any]:
+        """Load aggregate counters from file"""
         try:
-            with open(self.feedback_file, 'r') as f:
-                return json.load(f)
+            with open(self.stats_file, 'rb') as f:
+                return orjson.loads(f.read())
         except Exception as e:
-            logger.error(f"Error loading feedback data: {e}")
-            return {
-                "total_feedback": 0,
-                "accurate_count": 0,
-                "inaccurate_count": 0,
-                "accuracy_rate": 0.0,
-                "last_updated": datetime.now().isoformat(),
-                "feedback_entries": []
-            }
+            logger.error(f"Error loading feedback stats: {e}")
+            return self._initial_stats()
     
-    def save_feedback_data(self, data: Dict[str, Any]):
-        """Save feedback data to file"""
+    def save_stats(self, stats: Dict[str, Any]):
+        """Save aggregate counters to file"""
         try:
-            with open(self.feedback_file, 'w') as f:
-                json.dump(data, f, indent=2)
+            with open(self.stats_file, 'wb') as f:
+                f.write(orjson.dumps(stats, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
         except Exception as e:
-            logger.error(f"Error saving feedback data: {e}")
+            logger.error(f"Error saving feedback stats: {e}")
+    
+    def _file_key(self, path: Path) -> Optional[tuple]:
+        """Change-detection key for a file: (mtime_ns, size), or None if missing"""
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+    
+    def load_entries(self) -> list:
+        """Load the most recent max_entries feedback entries from the log, latest per file"""
+        key = self._file_key(self.entries_file)
+        if key is None:
+            return []
+        if key == self._cached_entries_key:
+            return self._cached_entries
+        
+        try:
+            with open(self.entries_file, 'rb') as f:
+                lines = f.read().splitlines()[-self.max_entries:]
+        except Exception as e:
+            logger.error(f"Error loading feedback entries: {e}")
+            return []
+        
+        entries = []
+        for line in lines:
+            try:
+                entries.append(orjson.loads(line))
+            except orjson.JSONDecodeError:
+                # A torn final line from an interrupted append
+                continue
+        # A resubmission for a file supersedes its earlier entries
+        entries = self._latest_per_file(entries)
+        
+        self._cached_entries = entries
+        self._cached_entries_key = key
+        return entries
+    
+    def _invalidate_cache(self):
+        """Drop cached entries and stats after this process changes the files"""
+        self._cached_entries = None
+        self._cached_entries_key = None
+        self._cached_stats = None
+        self._cached_stats_key = None
+    
+    def _append_entry(self, entry: Dict[str, Any]):
+        """Append one entry to the log, compacting it (superseded entries dropped) when it grows too large"""
+        with open(self.entries_file, 'ab') as f:
+            f.write(orjson.dumps(entry) + b'\n')
+            size = f.tell()
+        
+        if size > self.max_entries_file_bytes:
+            self._write_entries(self.load_entries())
+    
+    def _write_entries(self, entries: list):
+        """Replace the entries log atomically"""
+        tmp_file = self.entries_file.with_suffix('.jsonl.tmp')
+        with open(tmp_file, 'wb') as f:
+            f.write(b''.join(orjson.dumps(entry) + b'\n' for entry in entries))
+        os.replace(tmp_file, self.entries_file)
+    
+    def _persist_feedback(self, entry: Dict[str, Any], stats: Dict[str, Any]):
+        """Append the entry, then save the updated counters"""
+        self._append_entry(entry)
+        self.save_stats(stats)
+        self._invalidate_cache()
+    
+    def load_feedback_data(self) -> Dict[str, Any]:
+        """Load counters and recent entries as one dict (legacy single-file shape)"""
+        data = self.load_stats()
+        data["feedback_entries"] = self.load_entries()
+        return data
     
     async def submit_feedback(
         self, 
@@ -77,69 +245,126 @@ class AccuracyFeedbackService:
         Returns:
             Dict with submission status and updated statistics
         """
-        try:
-            # Load current data
-            data = self.load_feedback_data()
-            
-            # Create feedback entry
-            feedback_entry = {
-                "file_id": file_id,
-                "is_accurate": is_accurate,
-                "extraction_method": extraction_method,
-                "user_tier": user_tier,
-                "timestamp": datetime.now().isoformat(),
-                "additional_notes": additional_notes
-            }
-            
-            # Update counters
-            data["total_feedback"] += 1
+        async with self._lock:
+            try:
+                # Load current counters; the entry history is appended, never rewritten.
+                # File I/O runs in a worker thread so other requests keep being served
+                data = await asyncio.to_thread(self.load_stats)
+                
+                # Create feedback entry
+                feedback_entry = {
+                    "file_id": file_id,
+                    "is_accurate": is_accurate,
+                    "extraction_method": extraction_method,
+                    "user_tier": user_tier,
+                    "timestamp": datetime.now().isoformat(),
+                    "additional_notes": additional_notes
+                }
+                
+                # A repeat submission for the same file (e.g. a double click) replaces
+                # the earlier one instead of being counted twice
+                file_index = data.setdefault("file_index", {})
+                previous = file_index.pop(file_id, None)
+                if previous is not None:
+                    self._retract_feedback(data, file_id, *previous)
+                
+                # Update counters
+                data["total_feedback"] += 1
+                if is_accurate:
+                    data["accurate_count"] += 1
+                else:
+                    data["inaccurate_count"] += 1
+                
+                # Calculate new accuracy rate
+                if data["total_feedback"] > 0:
+                    data["accuracy_rate"] = (data["accurate_count"] / data["total_feedback"]) * 100
+                
+                data["last_updated"] = datetime.now().isoformat()
+                
+                # Update running aggregates so stats requests never rescan entries
+                counts = data.setdefault("method_breakdown", {}).setdefault(
+                    extraction_method, {"total": 0, "accurate": 0})
+                counts["total"] += 1
+                if is_accurate:
+                    counts["accurate"] += 1
+                
+                now = int(time.time())
+                cutoff = now - self.recent_window_days * 86400
+                recent_window = [item for item in data.get("recent_window", []) if item[0] >= cutoff]
+                recent_window.append([now, is_accurate, file_id])
+                data["recent_window"] = recent_window[-self.max_entries:]
+                
+                file_index[file_id] = [now, is_accurate, extraction_method]
+                
+                await asyncio.to_thread(self._persist_feedback, feedback_entry, data)
+                
+                logger.info(f"Feedback {'updated' if previous else 'submitted'}: {file_id}, accurate: {is_accurate}")
+                
+                return {
+                    "success": True,
+                    "message": "Feedback updated successfully" if previous else "Feedback submitted successfully",
+                    "accuracy_rate": round(data["accuracy_rate"], 1),
+                    "total_feedback": data["total_feedback"],
+                    "accurate_count": data["accurate_count"]
+                }
+                
+            except Exception as e:
+                logger.error(f"Error submitting feedback: {e}")
+                return {
+                    "success": False,
+                    "message": "Failed to submit feedback",
+                    "error": str(e)
+                }
+    
+    def _retract_feedback(self, data: Dict[str, Any], file_id: str, epoch: int, is_accurate: bool,
+                          extraction_method: str):
+        """Remove an earlier submission from the counters and running aggregates"""
+        data["total_feedback"] -= 1
+        if is_accurate:
+            data["accurate_count"] -= 1
+        else:
+            data["inaccurate_count"] -= 1
+        
+        counts = data.get("method_breakdown", {}).get(extraction_method)
+        if counts is not None:
+            counts["total"] -= 1
             if is_accurate:
-                data["accurate_count"] += 1
-            else:
-                data["inaccurate_count"] += 1
-            
-            # Calculate new accuracy rate
-            if data["total_feedback"] > 0:
-                data["accuracy_rate"] = (data["accurate_count"] / data["total_feedback"]) * 100
-            
-            data["last_updated"] = datetime.now().isoformat()
-            
-            # Add to entries (keep last 1000 entries)
-            data["feedback_entries"].append(feedback_entry)
-            if len(data["feedback_entries"]) > 1000:
-                data["feedback_entries"] = data["feedback_entries"][-1000:]
-            
-            # Save updated data
-            self.save_feedback_data(data)
-            
-            logger.info(f"Feedback submitted: {file_id}, accurate: {is_accurate}")
-            
-            return {
-                "success": True,
-                "message": "Feedback submitted successfully",
-                "accuracy_rate": round(data["accuracy_rate"], 1),
-                "total_feedback": data["total_feedback"],
-                "accurate_count": data["accurate_count"]
-            }
-            
-        except Exception as e:
-            logger.error(f"Error submitting feedback: {e}")
-            return {
-                "success": False,
-                "message": "Failed to submit feedback",
-                "error": str(e)
-            }
+                counts["accurate"] -= 1
+            if counts["total"] <= 0:
+                del data["method_breakdown"][extraction_method]
+        
+        recent_window = data.get("recent_window", [])
+        try:
+            recent_window.remove([epoch, is_accurate, file_id])
+        except ValueError:
+            pass  # Already aged out of the window
     
     async def get_accuracy_stats(self) -> Dict[str, Any]:
         """Get current accuracy statistics"""
+        async with self._lock:
+            key = (self._file_key(self.stats_file), self._file_key(self.entries_file))
+            if (self._cached_stats is not None and key == self._cached_stats_key
+                    and time.monotonic() - self._cached_stats_time < self.stats_cache_ttl):
+                # A copy, so a caller changing the response cannot change later ones
+                return copy.deepcopy(self._cached_stats)
+            
+            stats = await asyncio.to_thread(self._compute_accuracy_stats)
+            self._cached_stats = stats
+            self._cached_stats_key = key
+            self._cached_stats_time = time.monotonic()
+            return copy.deepcopy(stats)
+    
+    def _compute_accuracy_stats(self) -> Dict[str, Any]:
+        """Build the accuracy statistics response from the feedback files"""
         try:
-            data = self.load_feedback_data()
+            data = self.load_stats()
             
-            # Calculate additional metrics
-            recent_entries = self._get_recent_feedback(data["feedback_entries"], days=30)
+            # Calculate additional metrics from the running aggregates
+            cutoff = time.time() - self.recent_window_days * 86400
+            recent_entries = [item for item in data.get("recent_window", []) if item[0] >= cutoff]
             recent_accuracy = self._calculate_accuracy_rate(recent_entries)
             
-            method_stats = self._get_method_statistics(data["feedback_entries"])
+            method_stats = self._get_method_statistics(data.get("method_breakdown", {}))
             
             return {
                 "total_feedback": data["total_feedback"],
@@ -181,36 +406,27 @@ class AccuracyFeedbackService:
         
         return recent_entries
     
-    def _calculate_accuracy_rate(self, entries: list) -> Optional[float]:
-        """Calculate accuracy rate for given entries"""
-        if not entries:
+    def _calculate_accuracy_rate(self, recent_window: list) -> Optional[float]:
+        """Calculate accuracy rate for [epoch_seconds, is_accurate, file_id] window items"""
+        if not recent_window:
             return None
         
-        accurate_count = sum(1 for entry in entries if entry.get("is_accurate", False))
-        return (accurate_count / len(entries)) * 100
+        accurate_count = sum(1 for item in recent_window if item[1])
+        return (accurate_count / len(recent_window)) * 100
     
-    def _get_method_statistics(self, entries: list) -> Dict[str, Dict[str, Any]]:
+    def _get_method_statistics(self, method_breakdown: Dict[str, Dict[str, int]]) -> Dict[str, Dict[str, Any]]:
         """Get accuracy statistics broken down by extraction method"""
         method_stats = {}
         
-        for entry in entries:
-            method = entry.get("extraction_method", "unknown")
-            if method not in method_stats:
-                method_stats[method] = {
-                    "total": 0,
-                    "accurate": 0,
-                    "accuracy_rate": 0.0
-                }
-            
-            method_stats[method]["total"] += 1
-            if entry.get("is_accurate", False):
-                method_stats[method]["accurate"] += 1
-        
-        # Calculate rates
-        for method in method_stats:
-            total = method_stats[method]["total"]
-            accurate = method_stats[method]["accurate"]
-            method_stats[method]["accuracy_rate"] = round((accurate / total) * 100, 1) if total > 0 else 0
+        # Calculate rates from the running counters
+        for method, counts in method_breakdown.items():
+            total = counts["total"]
+            accurate = counts["accurate"]
+            method_stats[method] = {
+                "total": total,
+                "accurate": accurate,
+                "accuracy_rate": round((accurate / total) * 100, 1) if total > 0 else 0
+            }
         
         return method_stats
     
@@ -16,6 +16,8 @@ from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from contextlib import asynccontextmanager
+import asyncio
+import io
 import tempfile
 import shutil
 from pathlib import Path
@@ -51,10 +53,44 @@ logger = logging.getLogger(__name__)
 limiter = Limiter(key_func=get_remote_address)
 
 # Initialize security components
-pdf_validator = SecurePDFValidator()
+pdf_validator = SecurePDFValidator.get_instance()
 file_handler = SecureFileHandler()
 # rate_limiter imported from security.rate_limiter
 
+def warm_extraction_stack():
+    """
+    Exercise the PDF stack once at startup (blocking)
+    
+    The libraries are imported with this module, but pdfplumber/pdfminer still load
+    parsing and table-finding code on first use. Running them over a blank page here
+    keeps that off the first request served in this process. Extraction worker
+    processes still start cold and do not benefit.
+    """
+    import pypdf
+    
+    PDFTableExtractor()
+    writer = pypdf.PdfWriter()
+    writer.add_blank_page(width=72, height=72)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    buffer.seek(0)
+    
+    import pdfplumber
+    with pdfplumber.open(buffer) as pdf:
+        for page in pdf.pages:
+            page.extract_text()
+            page.extract_tables()
+
+async def _warm_up(app: FastAPI):
+    """Run the startup warm-up off the event loop and mark the service ready"""
+    try:
+        await asyncio.to_thread(warm_extraction_stack)
+        logger.info("PDF extraction stack warmed up")
+    except Exception as e:
+        # A failed warm-up only costs the first request its cold start
+        logger.warning(f"PDF extraction warm-up failed: {e}")
+    app.state.extraction_ready.set()
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan handler for startup/shutdown"""
@@ -66,8 +102,14 @@ async def lifespan(app: FastAPI):
     upload_dir.mkdir(parents=True, exist_ok=True)
     logger.info(f"Upload directory ready: {upload_dir}")
     
+    # Warm the extraction stack in the background; /ready reports when it is done
+    app.state.extraction_ready = asyncio.Event()
+    warm_up_task = asyncio.create_task(_warm_up(app))
+    
     yield
     
+    warm_up_task.cancel()
+    
     # Shutdown
     logger.info("Shutting down PDF Table Extractor API")
     
@@ -169,6 +211,13 @@ async def health_check():
         "uptime": datetime.now().isoformat()
     }
 
+@app.get("/ready", tags=["health"])
+async def readiness_check():
+    """Readiness probe: 503 until the startup warm-up has finished"""
+    if not app.state.extraction_ready.is_set():
+        return JSONResponse(status_code=503, content={"status": "warming_up"})
+    return {"status": "ready"}
+
 @app.post("/extract", tags=["extraction"])
 @limiter.limit("10/minute")  # P0 Security: Rate limiting
 async def extract_tables(
@@ -247,16 +296,20 @@ async def extract_tables(
         if len(file_content) > 10 * 1024 * 1024:
             raise HTTPException(status_code=413, detail="File too large (max 10MB)")
         
-        # P0 Security: Validate file type and content
-        pdf_validator.validate_file_content(file_content)
         pdf_validator.validate_filename(file.filename)
         
-        # P0 Security: Save file securely
+        # P0 Security: Save file securely (owner-only, removed again in the finally block)
         file_id = file_handler.secure_save_file(file_content, file.filename)
         temp_file_path = file_handler.get_file_path(file_id)
+        # The content checks scan the saved file through a read-only memory map,
+        # so the upload's bytes need not stay in memory meanwhile
+        del file_content
+        
+        # P0 Security: Validate file type and content (off the event loop)
+        await pdf_validator.validate_file_path_async(str(temp_file_path))
         
         # P0 Security: Additional PDF validation
-        pdf_validator.validate_pdf_file(str(temp_file_path))
+        await pdf_validator.validate_pdf_file_async(str(temp_file_path))
         
         # Extract tables with user tier for OCR feature
         extractor = PDFTableExtractor()
@@ -4,21 +4,38 @@ Validates PDF files for security threats including embedded JavaScript, maliciou
 """
 
 import os
+import re
+import copy
+import mmap
+import asyncio
 import logging
 import hashlib
+import threading
+from collections import OrderedDict
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Set, Tuple
+import numpy as np
 import pypdf
 from pypdf.errors import PdfReadError
+from pypdf.generic import ArrayObject, DictionaryObject, NameObject
 import tempfile
+from enum import Enum
+
+# Prefer puremagic (pure-Python, header-only signature table), then python-magic,
+# then fall back to the basic header validation alone
+try:
+    import puremagic
+    HAS_PUREMAGIC = True
+except ImportError:
+    HAS_PUREMAGIC = False
 
-# Try to import python-magic, fallback to basic validation if not available
 try:
     import magic
     HAS_MAGIC = True
 except ImportError:
     HAS_MAGIC = False
-    print("Warning: python-magic not available, using basic file validation")
+    if not HAS_PUREMAGIC:
+        print("Warning: puremagic/python-magic not available, using basic file validation")
 
 logger = logging.getLogger(__name__)
 
@@ -26,6 +43,12 @@ class SecurityError(Exception):
     """Custom security exception for PDF validation"""
     pass
 
+class JsVerdict(Enum):
+    """Classification of JavaScript-bearing PDF content"""
+    SAFE = "safe"              # No dangerous patterns (form field references only)
+    SUSPICIOUS = "suspicious"  # Dangerous patterns present but below the malicious score
+    MALICIOUS = "malicious"    # Scored as genuinely dangerous JavaScript
+
 class SecurePDFValidator:
     """
     Secure PDF validator implementing P0 security measures:
@@ -37,42 +60,180 @@ class SecurePDFValidator:
     - Suspicious content pattern detection
     """
     
+    # Pattern tables and compiled matchers are fixed configuration, so they are
+    # built once at import and shared by every instance instead of per request.
+    
+    # Known dangerous PDF features
+    dangerous_features = (
+        '/JavaScript',
+        '/JS',
+        '/EmbeddedFiles',
+        '/EmbeddedFile', 
+        '/GoToE',
+        '/GoToR',
+        '/Launch',
+        '/SubmitForm',
+        '/ImportData'
+    )
+    _dangerous_feature_set = frozenset(dangerous_features)
+    
+    # Suspicious content patterns
+    suspicious_patterns = (
+        b'eval(',
+        b'unescape(',
+        b'String.fromCharCode(',
+        b'document.write(',
+        b'ActiveXObject',
+        b'WScript.Shell',
+        b'cmd.exe',
+        b'powershell'
+    )
+    
+    # Single alternation over all patterns so one C-level pass finds any of them.
+    # sre compiles the alternatives' first bytes into a charset prefilter, so
+    # positions that cannot start a pattern are skipped without verification.
+    _suspicious_re = re.compile(b'|'.join(re.escape(p) for p in suspicious_patterns))
+    _suspicious_overlap = max(len(p) for p in suspicious_patterns) - 1
+    
+    # '/JavaScript' or '/JS' name references in serialized page/annotation objects
+    _js_reference_re = re.compile(r'/J(?:avaScript|S)')
+    _js_reference_names = frozenset(('/JavaScript', '/JS'))
+    
+    # JavaScript classification tables are pre-lowered so the per-annotation
+    # checks only lower the content being inspected.
+    
+    # Patterns that indicate TRULY dangerous JavaScript vs legitimate business use
+    js_dangerous_patterns = (
+        'eval(',
+        'unescape(',
+        'activexobject',
+        'wscript.shell',
+        'cmd.exe',
+        'powershell.exe',
+        'document.write',
+        'xmlhttprequest',
+        'fetch(',
+        'iframe',
+        'script'
+    )
+    
+    # Patterns that are common in business PDFs and should be allowed
+    js_business_safe_patterns = (
+        'function',       # Form validation functions
+        'window.open',    # Help links, print dialogs
+        'location.href',  # Navigation within business sites
+        'onload',         # Standard form initialization
+        'settimeout',     # Form behavior timing
+        'setinterval'     # Form refresh patterns
+    )
+    
+    # Risk tiers used for malicious scoring as (label, patterns, weight)
+    # (label, patterns, score per hit, log level for a hit)
+    js_risk_tiers = (
+        # High confidence malicious patterns
+        ('High-risk', ('eval(', 'unescape(', 'activexobject', 'wscript.shell', 'cmd.exe',
+                       'powershell.exe', 'document.write', 'iframe'), 3, logging.WARNING),
+        # Medium risk patterns that need context
+        ('Medium-risk', ('xmlhttprequest', 'fetch(', 'script'), 2, logging.INFO),
+        # Low risk patterns (common in business PDFs)
+        ('Low-risk', ('location.href', 'window.open', 'onload', 'onerror', 'settimeout', 'setinterval'), 1,
+         logging.DEBUG)
+    )
+    external_domain_patterns = ('http://', 'https://', 'ftp://')
+    js_malicious_score_threshold = 6
+    
+    # Safe business annotation types
+    safe_annotation_types = (
+        '/Text',      # Text annotations (comments, notes)
+        '/Highlight', # Text highlighting
+        '/Link',      # Hyperlinks (navigation)
+        '/FreeText',  # Free text annotations
+        '/Square',    # Rectangle annotations
+        '/Circle',    # Circle annotations
+        '/Line',      # Line annotations
+        '/Polygon',   # Polygon annotations
+        '/Ink',       # Freehand annotations
+        '/Stamp',     # Stamp annotations
+        '/Widget'     # Form widgets (fields, buttons)
+    )
+    
+    # Business domain whitelist for annotation URLs
+    business_domains = (
+        'microsoft.com', 'office.com', 'adobe.com', 'google.com',
+        'salesforce.com', 'quickbooks.com', 'xero.com', 'sage.com',
+        'dropbox.com', 'box.com', 'sharepoint.com'
+    )
+    
+    # Document info fields copied into validation results
+    safe_metadata_fields = frozenset(
+        ('/Title', '/Author', '/Subject', '/Creator', '/Producer', '/CreationDate', '/ModDate')
+    )
+    
+    # Filename sequences rejected by validate_filename, in reporting order
+    dangerous_filename_sequences = ('..', '/', '\\', ':', '*', '?', '"', '<', '>', '|', '\x00')
+    _dangerous_filename_chars = frozenset(c for c in dangerous_filename_sequences if len(c) == 1)
+    
+    _instance = None
+    _instance_lock = threading.Lock()
+    
     def __init__(self):
         self.max_pages = 100
         self.max_processing_time = 60  # seconds
         self.max_file_size_mb = 10
+        # Bytes per tile in the fused content scan; small enough that the regex
+        # pass and the histogram pass over a tile both hit L2
+        self.scan_chunk_size = 256 * 1024
+        self.bomb_check_min_size = 100000  # bytes; smaller files skip the PDF bomb heuristics
+        
+        # validate_pdf_file outcomes keyed by SHA-256 of the file, least recently used first
+        self.result_cache_size = 256
+        self._result_cache: "OrderedDict[str, Any]" = OrderedDict()
+        self._result_cache_lock = threading.Lock()
+    
+    @classmethod
+    def get_instance(cls) -> "SecurePDFValidator":
+        """Return the shared validator, creating it on first use"""
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+    
+    def validate_file_path(self, file_path: str, report: bool = False) -> Dict[str, Any]:
+        """
+        Validate an on-disk file's raw content without reading it into memory
         
-        # Known dangerous PDF features
-        self.dangerous_features = [
-            '/JavaScript',
-            '/JS',
-            '/EmbeddedFiles',
-            '/EmbeddedFile', 
-            '/GoToE',
-            '/GoToR',
-            '/Launch',
-            '/SubmitForm',
-            '/ImportData'
-        ]
-        
-        # Suspicious content patterns
-        self.suspicious_patterns = [
-            b'eval(',
-            b'unescape(',
-            b'String.fromCharCode(',
-            b'document.write(',
-            b'ActiveXObject',
-            b'WScript.Shell',
-            b'cmd.exe',
-            b'powershell'
-        ]
-    
-    def validate_file_content(self, file_content: bytes) -> Dict[str, Any]:
+        The file is memory-mapped read-only and scanned in place, so peak memory
+        stays at the page cache rather than a second copy of the upload.
+        
+        Args:
+            file_path: Path to the file to validate
+            report: Enumerate every suspicious pattern instead of stopping at the first hit
+            
+        Returns:
+            Dict containing validation results (see validate_file_content)
+            
+        Raises:
+            SecurityError: If security threats detected
+            ValueError: If file validation fails
+        """
+        with open(file_path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                raise ValueError("Invalid PDF file (file is empty)")
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as file_map:
+                return self.validate_file_content(file_map, report=report)
+    
+    async def validate_file_path_async(self, file_path: str, report: bool = False) -> Dict[str, Any]:
+        """Run validate_file_path in a worker thread so the event loop keeps serving requests"""
+        return await asyncio.to_thread(self.validate_file_path, file_path, report)
+    
+    def validate_file_content(self, file_content: bytes, report: bool = False) -> Dict[str, Any]:
         """
         Validate raw file content for security threats
         
         Args:
-            file_content: Raw PDF file bytes
+            file_content: Raw PDF file bytes (or a read-only mmap of them)
+            report: Enumerate every suspicious pattern instead of stopping at the first hit
             
         Returns:
             Dict containing validation results
@@ -95,29 +256,38 @@ class SecurePDFValidator:
         
         # P0 Security: Check magic bytes (not just extension)
         try:
-            if HAS_MAGIC:
-                mime_type = magic.from_buffer(file_content, mime=True)
-                validation_result['mime_type'] = mime_type
-                
-                if mime_type != 'application/pdf':
+            # ISO 32000 allows the %PDF- header anywhere in the first 1024 bytes
+            header_offset = file_content[:1024].find(b'%PDF-')
+            if header_offset == -1:
+                raise ValueError("Invalid PDF file (missing PDF header)")
+            validation_result['mime_type'] = 'application/pdf'
+            
+            # Defense in depth: MIME sniffing only needs the header region
+            mime_type = self._detect_mime_type(file_content[:4096])
+            if header_offset == 0:
+                # A PDF that starts with its header must be identified as one
+                if mime_type is not None and mime_type != 'application/pdf':
                     raise ValueError(f"Invalid PDF file (detected: {mime_type})")
-            else:
-                # Fallback: Check PDF magic bytes manually
-                if not file_content.startswith(b'%PDF-'):
-                    raise ValueError("Invalid PDF file (missing PDF header)")
-                validation_result['mime_type'] = 'application/pdf'
+            elif mime_type not in (None, 'application/pdf', 'application/octet-stream'):
+                # Junk-prefixed PDFs come back unidentified, so only reject a positive mismatch
+                raise ValueError(f"Invalid PDF file (detected: {mime_type})")
                 
         except Exception as e:
             raise ValueError(f"Could not determine file type: {e}")
         
-        # P0 Security: Scan for suspicious patterns in raw content
-        threats = self._scan_suspicious_patterns(file_content)
+        # P0 Security: Scan for suspicious patterns in raw content, building the
+        # byte histogram for the PDF bomb check in the same pass.
+        # The verdict is decided by the first hit, so only enumerate when a report is requested
+        threats, byte_counts = self._scan_content(
+            file_content, report=report,
+            histogram=len(file_content) >= self.bomb_check_min_size
+        )
         if threats:
             validation_result['threats_detected'].extend(threats)
             raise SecurityError(f"Suspicious content detected: {', '.join(threats)}")
         
         # P0 Security: Check for PDF bomb indicators (extreme compression ratios)
-        compression_warnings = self._check_compression_ratio(file_content)
+        compression_warnings = self._check_compression_ratio(file_content, byte_counts)
         if compression_warnings:
             validation_result['warnings'].extend(compression_warnings)
         
@@ -126,6 +296,23 @@ class SecurePDFValidator:
         
         return validation_result
     
+    async def validate_file_content_async(self, file_content: bytes, report: bool = False) -> Dict[str, Any]:
+        """Run validate_file_content in a worker thread so the event loop keeps serving requests"""
+        return await asyncio.to_thread(self.validate_file_content, file_content, report)
+    
+    def _detect_mime_type(self, header: bytes) -> Optional[str]:
+        """Sniff the MIME type of a header prefix, or None when no detector is installed"""
+        if HAS_PUREMAGIC:
+            try:
+                mime_type = puremagic.from_string(bytes(header), mime=True)
+            except puremagic.PureError:
+                mime_type = None
+            # Unidentified data gets libmagic's verdict for it, not "no verdict"
+            return mime_type or 'application/octet-stream'
+        if HAS_MAGIC:
+            return magic.from_buffer(header, mime=True)
+        return None
+    
     def validate_filename(self, filename: str):
         """
         Validate filename for security issues
@@ -146,11 +333,12 @@ class SecurePDFValidator:
         if not safe_filename.lower().endswith('.pdf'):
             raise ValueError("File must have .pdf extension")
         
-        # Check for dangerous characters
-        dangerous_chars = ['..', '/', '\\', ':', '*', '?', '"', '<', '>', '|', '\x00']
-        for char in dangerous_chars:
-            if char in filename:
-                raise ValueError(f"Invalid character in filename: {repr(char)}")
+        # Check for dangerous characters: one set test covers every single character,
+        # and the loop only runs on rejection to name the offending one
+        if '..' in filename or not self._dangerous_filename_chars.isdisjoint(filename):
+            for char in self.dangerous_filename_sequences:
+                if char in filename:
+                    raise ValueError(f"Invalid character in filename: {repr(char)}")
         
         # Check filename length
         if len(safe_filename) > 255:
@@ -158,12 +346,15 @@ class SecurePDFValidator:
         
         logger.debug(f"Filename validation passed: {safe_filename}")
     
-    def validate_pdf_file(self, file_path: str) -> Dict[str, Any]:
+    def validate_pdf_file(self, file_path: str, content_hash: Optional[str] = None) -> Dict[str, Any]:
         """
         Comprehensive PDF file validation with structure analysis
         
+        Results are cached by file content, so re-uploads of the same PDF skip parsing.
+        
         Args:
             file_path: Path to PDF file
+            content_hash: SHA-256 hex digest of the file, if the caller already has it
             
         Returns:
             Dict containing detailed validation results
@@ -177,6 +368,45 @@ class SecurePDFValidator:
         if not file_path.exists():
             raise ValueError("PDF file does not exist")
         
+        if content_hash is None:
+            content_hash = self.calculate_file_hash(str(file_path))
+        
+        if content_hash:
+            with self._result_cache_lock:
+                cached = self._result_cache.get(content_hash)
+                if cached is not None:
+                    self._result_cache.move_to_end(content_hash)
+            
+            if isinstance(cached, SecurityError):
+                logger.info("PDF validation cache hit (rejected)")
+                raise SecurityError(*cached.args)
+            if cached is not None:
+                logger.info("PDF validation cache hit")
+                return copy.deepcopy(cached)
+        
+        try:
+            validation_result = self._validate_pdf_file_uncached(file_path)
+        except SecurityError as e:
+            # Threat verdicts depend only on content; parse failures may be transient
+            # (a fresh instance, so the cache does not pin the traceback's frames)
+            if content_hash:
+                self._cache_result(content_hash, SecurityError(*e.args))
+            raise
+        
+        if content_hash:
+            self._cache_result(content_hash, copy.deepcopy(validation_result))
+        return validation_result
+    
+    def _cache_result(self, content_hash: str, outcome: Any):
+        """Store a validate_pdf_file outcome, evicting the least recently used entry"""
+        with self._result_cache_lock:
+            self._result_cache[content_hash] = outcome
+            self._result_cache.move_to_end(content_hash)
+            while len(self._result_cache) > self.result_cache_size:
+                self._result_cache.popitem(last=False)
+    
+    def _validate_pdf_file_uncached(self, file_path: Path) -> Dict[str, Any]:
+        """Parse and scan a PDF file; the body of validate_pdf_file"""
         validation_result = {
             'valid': False,
             'file_size': file_path.stat().st_size,
@@ -190,19 +420,24 @@ class SecurePDFValidator:
         }
         
         try:
-            # P0 Security: Open PDF with strict parsing
-            with open(file_path, 'rb') as f:
+            # Empty files cannot be memory-mapped (and are not valid PDFs anyway)
+            if validation_result['file_size'] == 0:
+                raise ValueError("Corrupted or invalid PDF: file is empty")
+            
+            # P0 Security: Open PDF with strict parsing over a read-only memory map
+            with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as pdf_map:
                 try:
-                    pdf_reader = pypdf.PdfReader(f, strict=True)
+                    pdf_reader = pypdf.PdfReader(pdf_map, strict=True)
                 except PdfReadError as e:
                     raise ValueError(f"Corrupted or invalid PDF: {e}")
                 
                 # Basic PDF info
-                validation_result['page_count'] = len(pdf_reader.pages)
+                page_count = len(pdf_reader.pages)
+                validation_result['page_count'] = page_count
                 validation_result['encrypted'] = pdf_reader.is_encrypted
                 
                 # P0 Security: Check page count limit
-                if len(pdf_reader.pages) > self.max_pages:
+                if page_count > self.max_pages:
                     raise ValueError(f"PDF exceeds {self.max_pages} pages limit")
                 
                 # P0 Security: Check for encryption (we don't handle encrypted PDFs)
@@ -248,98 +483,208 @@ class SecurePDFValidator:
         
         return validation_result
     
-    def _scan_suspicious_patterns(self, content: bytes) -> List[str]:
-        """Scan raw content for suspicious patterns"""
-        threats = []
+    async def validate_pdf_file_async(self, file_path: str) -> Dict[str, Any]:
+        """Run validate_pdf_file in a worker thread so the event loop keeps serving requests"""
+        return await asyncio.to_thread(self.validate_pdf_file, file_path)
+    
+    def _scan_content(self, content: bytes, report: bool = False,
+                      histogram: bool = True) -> Tuple[List[str], Optional[np.ndarray]]:
+        """
+        Fused single pass over raw content for suspicious patterns and the byte histogram
         
-        for pattern in self.suspicious_patterns:
-            if pattern in content:
-                threat_name = pattern.decode('utf-8', errors='ignore')
-                threats.append(f"Suspicious pattern: {threat_name}")
-                logger.warning(f"Suspicious pattern detected: {threat_name}")
+        Each scan_chunk_size slice is pattern-searched and then histogrammed while it
+        is still in cache, instead of walking the whole buffer once per check.
         
+        Args:
+            content: Raw file bytes (or a read-only mmap of them)
+            report: Enumerate every suspicious pattern instead of stopping at the first hit
+            histogram: Also accumulate the 256-bin byte histogram
+            
+        Returns:
+            Tuple of (threat descriptions, byte histogram or None). The histogram is
+            None when not requested or when the scan stopped early on a threat.
+        """
+        # Matches may straddle slice boundaries, so each search window starts
+        # this many bytes before its slice
+        overlap = self._suspicious_overlap
+        found = {}  # pattern -> None; a dict keeps first-seen order
+        byte_counts = np.zeros(256, dtype=np.int64) if histogram else None
+        
+        # frombuffer views the bytes (or mmap) without copying
+        data = np.frombuffer(content, dtype=np.uint8)
+        try:
+            complete = False
+            for offset in range(0, data.size, self.scan_chunk_size):
+                end = offset + self.scan_chunk_size
+                for match in self._suspicious_re.finditer(content, max(0, offset - overlap), end):
+                    found[match.group()] = None
+                    # One hit decides the verdict; a report is complete once every pattern is seen
+                    if not report or len(found) == len(self.suspicious_patterns):
+                        complete = True
+                        break
+                
+                if complete:
+                    byte_counts = None  # stopped early, so the histogram would be partial
+                    break
+                
+                if byte_counts is not None:
+                    # bincount runs per slice to bound its intp temporary
+                    byte_counts += np.bincount(data[offset:end], minlength=256)
+        finally:
+            del data  # release the buffer export so a caller's mmap can close
+        
+        threats = []
+        for pattern in found:
+            threat_name = pattern.decode('utf-8', errors='ignore')
+            threats.append(f"Suspicious pattern: {threat_name}")
+            logger.warning(f"Suspicious pattern detected: {threat_name}")
+        
+        return threats, byte_counts
+    
+    def _scan_suspicious_patterns(self, content: bytes) -> List[str]:
+        """Scan raw content for suspicious patterns"""
+        threats, _ = self._scan_content(content, report=True, histogram=False)
         return threats
     
-    def _check_compression_ratio(self, content: bytes) -> List[str]:
+    def _check_compression_ratio(self, content: bytes,
+                                 byte_counts: Optional[np.ndarray] = None) -> List[str]:
         """Check for extreme compression ratios (PDF bomb indicator)"""
         warnings = []
         
+        # A file this small cannot be a meaningful decompression bomb
+        if len(content) < self.bomb_check_min_size:
+            return warnings
+        
+        # One byte histogram answers both heuristics; reuse the fused scan's when given
+        if byte_counts is None:
+            _, byte_counts = self._scan_content(content, report=True)
+        
         # Simple heuristic: check for repeated null bytes or patterns
-        null_ratio = content.count(b'\x00') / len(content)
+        null_ratio = int(byte_counts[0]) / len(content)
         if null_ratio > 0.9:
             warnings.append("High null byte ratio - potential PDF bomb")
         
         # Check for extremely repetitive content
-        if len(set(content)) < 50 and len(content) > 100000:
+        unique_bytes = int(np.count_nonzero(byte_counts))
+        if unique_bytes < 50:
             warnings.append("Extremely repetitive content - potential PDF bomb")
         
         return warnings
     
     def _scan_pdf_structure(self, pdf_reader: pypdf.PdfReader) -> List[str]:
         """Scan PDF structure for dangerous features"""
-        dangerous_found = []
+        # Bit i is set when self.dangerous_features[i] is found; keeps feature order without a set
+        found_flags = 0
         
         try:
             # Check PDF trailer for dangerous features
             if hasattr(pdf_reader, 'trailer') and pdf_reader.trailer:
-                trailer_str = str(pdf_reader.trailer)
+                trailer_names = self._collect_names(pdf_reader.trailer, self._dangerous_feature_set)
                 
-                for feature in self.dangerous_features:
-                    if feature in trailer_str:
-                        dangerous_found.append(feature)
+                for bit, feature in enumerate(self.dangerous_features):
+                    if feature in trailer_names:
+                        found_flags |= 1 << bit
                         logger.warning(f"Dangerous feature detected in trailer: {feature}")
             
             # Check PDF root object
             if hasattr(pdf_reader, 'root_object') and pdf_reader.root_object:
-                root_str = str(pdf_reader.root_object)
+                root_names = self._collect_names(pdf_reader.root_object, self._dangerous_feature_set)
                 
-                for feature in self.dangerous_features:
-                    if feature in root_str:
-                        dangerous_found.append(feature)
+                for bit, feature in enumerate(self.dangerous_features):
+                    if feature in root_names:
+                        found_flags |= 1 << bit
                         logger.warning(f"Dangerous feature detected in root: {feature}")
         
         except Exception as e:
             logger.warning(f"Could not scan PDF structure: {e}")
         
-        return list(set(dangerous_found))  # Remove duplicates
+        return [feature for bit, feature in enumerate(self.dangerous_features) if found_flags & (1 << bit)]
+    
+    def _collect_names(self, pdf_object, wanted: Optional[frozenset] = None) -> Set[str]:
+        """
+        Collect Name tokens (dictionary keys and name values) from a PDF object
+        
+        Walks the same direct-object tree that str() would serialize, without
+        following indirect references or building the intermediate string.
+        Stream objects contribute only their dictionary; their data is never read.
+        When wanted is given, only names in it are kept.
+        """
+        names = set()
+        pending = [pdf_object]
+        
+        while pending:
+            obj = pending.pop()
+            if isinstance(obj, DictionaryObject):
+                keys = obj.keys()
+                names.update(keys if wanted is None else wanted.intersection(keys))
+                # dict.values() keeps IndirectObject references unresolved
+                pending.extend(dict.values(obj))
+            elif isinstance(obj, ArrayObject):
+                pending.extend(obj)
+            elif isinstance(obj, NameObject):
+                if wanted is None or obj in wanted:
+                    names.add(obj)
+        
+        return names
     
     def _scan_pages_for_javascript(self, pdf_reader: pypdf.PdfReader) -> List[str]:
         """Scan PDF pages for embedded JavaScript - improved to distinguish dangerous JS from form fields"""
         js_threats = []
         
         try:
+            # Pages are scanned sequentially: PdfReader resolves objects lazily by
+            # seeking its shared stream, so concurrent page access is not safe
             for page_num, page in enumerate(pdf_reader.pages):
                 try:
-                    # Check page object for JavaScript
-                    page_str = str(page)
-                    
-                    # Only flag actual dangerous JavaScript, not form field annotations
-                    if '/JavaScript' in page_str or '/JS' in page_str:
-                        # Additional verification - look for actual JS content, not just form field structures
-                        if self._contains_actual_javascript(page_str):
-                            js_threats.append(f"Dangerous JavaScript code on page {page_num + 1}")
-                            logger.warning(f"Dangerous JavaScript code detected on page {page_num + 1}")
-                        else:
-                            logger.info(f"JavaScript reference found but appears to be form field on page {page_num + 1}")
-                    
-                    # Check annotations more carefully for actual dangerous JavaScript
-                    if '/Annots' in page_str:
-                        dangerous_annots = self._scan_annotations_for_dangerous_js(page, page_num)
-                        if dangerous_annots:
-                            js_threats.extend(dangerous_annots)
-                        else:
-                            # Safe annotations detected - allow legitimate business document annotations
-                            logger.debug(f"Safe business annotations detected on page {page_num + 1} - allowing")
-                
+                    js_threats.extend(self._scan_single_page(page, page_num))
                 except Exception as e:
                     logger.warning(f"Could not scan page {page_num + 1}: {e}")
                     continue
+                
+                # Any threat rejects the file, so later pages are never resolved
+                if js_threats:
+                    break
         
         except Exception as e:
             logger.warning(f"Could not scan pages for JavaScript: {e}")
         
         return js_threats
     
+    def _scan_single_page(self, page, page_num: int) -> List[str]:
+        """
+        Scan one page and its annotations for dangerous JavaScript
+        
+        Args:
+            page: PDF page object
+            page_num: Page number (0-indexed)
+            
+        Returns:
+            List of threat descriptions for the page
+        """
+        page_threats = []
+        
+        # Check page object for JavaScript by its Name tokens; the page is only
+        # serialized for content analysis when a JavaScript name is present
+        # Only flag actual dangerous JavaScript, not form field annotations
+        if self._collect_names(page, self._js_reference_names):
+            # Additional verification - look for actual JS content, not just form field structures
+            if self._contains_actual_javascript(str(page)):
+                page_threats.append(f"Dangerous JavaScript code on page {page_num + 1}")
+                logger.warning(f"Dangerous JavaScript code detected on page {page_num + 1}")
+            else:
+                logger.info(f"JavaScript reference found but appears to be form field on page {page_num + 1}")
+        
+        # Check annotations more carefully for actual dangerous JavaScript
+        if '/Annots' in page:
+            dangerous_annots = self._scan_annotations_for_dangerous_js(page, page_num)
+            if dangerous_annots:
+                page_threats.extend(dangerous_annots)
+            else:
+                # Safe annotations detected - allow legitimate business document annotations
+                logger.debug(f"Safe business annotations detected on page {page_num + 1} - allowing")
+        
+        return page_threats
+    
     def _contains_actual_javascript(self, content_str: str) -> bool:
         """
         Check if content contains actual dangerous JavaScript code vs form field references
@@ -350,46 +695,42 @@ class SecurePDFValidator:
         Returns:
             True if dangerous JavaScript detected, False if just form field structures
         """
-        # Patterns that indicate TRULY dangerous JavaScript vs legitimate business use
-        truly_dangerous_patterns = [
-            'eval(',
-            'unescape(',
-            'ActiveXObject',
-            'WScript.Shell',
-            'cmd.exe',
-            'powershell.exe',
-            'document.write',
-            'XMLHttpRequest',
-            'fetch(',
-            'iframe',
-            'script'
-        ]
-        
-        # Patterns that are common in business PDFs and should be allowed
-        business_safe_patterns = [
-            'function',  # Form validation functions
-            'window.open',  # Help links, print dialogs
-            'location.href',  # Navigation within business sites
-            'onload',  # Standard form initialization
-            'setTimeout',  # Form behavior timing
-            'setInterval'  # Form refresh patterns
-        ]
-        
         # Convert to lowercase for case-insensitive search
-        content_lower = content_str.lower()
+        return self._has_dangerous_javascript(content_str.lower())
+    
+    def _classify_javascript(self, content_lower: str) -> JsVerdict:
+        """
+        Classify JavaScript content with both checks sharing one lowered copy
         
+        Args:
+            content_lower: Lowercased string content to analyze
+            
+        Returns:
+            JsVerdict for the content
+        """
+        if not self._has_dangerous_javascript(content_lower):
+            return JsVerdict.SAFE
+        
+        # Double check for TRULY dangerous JS patterns
+        if self._is_truly_malicious_javascript(content_lower):
+            return JsVerdict.MALICIOUS
+        
+        return JsVerdict.SUSPICIOUS
+    
+    def _has_dangerous_javascript(self, content_lower: str) -> bool:
+        """Dangerous-pattern check behind _contains_actual_javascript, on lowercased content"""
         # Count truly dangerous patterns
         dangerous_count = 0
-        for pattern in truly_dangerous_patterns:
-            if pattern.lower() in content_lower:
+        for pattern in self.js_dangerous_patterns:
+            if pattern in content_lower:
                 dangerous_count += 1
                 logger.warning(f"Dangerous JavaScript pattern detected: {pattern}")
         
         # Check for business context - if it contains business-safe patterns,
         # require more evidence of malicious intent
         business_context_detected = False
-        for pattern in business_safe_patterns:
-            if pattern.lower() in content_lower:
+        for pattern in self.js_business_safe_patterns:
+            if pattern in content_lower:
                 business_context_detected = True
                 logger.debug(f"Business context pattern detected: {pattern}")
                 break
@@ -401,81 +742,33 @@ class SecurePDFValidator:
             # In non-business context, 1 dangerous pattern is enough
             return dangerous_count >= 1
     
-    def _is_truly_malicious_javascript(self, content_str: str) -> bool:
+    def _is_truly_malicious_javascript(self, content_lower: str) -> bool:
         """
         Check if JavaScript content is truly malicious vs legitimate business use
         
         Args:
-            content_str: String content to analyze for malicious patterns
+            content_lower: Lowercased string content to analyze for malicious patterns
             
         Returns:
             True if content contains genuinely dangerous JavaScript patterns
         """
-        # Patterns that indicate TRULY malicious JavaScript (high confidence)
-        high_risk_patterns = [
-            'eval(',
-            'unescape(',
-            'ActiveXObject',
-            'WScript.Shell',
-            'cmd.exe',
-            'powershell.exe',
-            'document.write',
-            'iframe'
-        ]
-        
-        # Medium risk patterns that need context
-        medium_risk_patterns = [
-            'XMLHttpRequest',
-            'fetch(',
-            'script'
-        ]
-        
-        # Low risk patterns (common in business PDFs)
-        low_risk_patterns = [
-            'location.href',
-            'window.open',
-            'onload',
-            'onerror',
-            'setTimeout',
-            'setInterval'
-        ]
-        
-        # Convert to lowercase for case-insensitive search
-        content_lower = content_str.lower()
-        
-        # Count patterns by risk level
-        high_risk_count = 0
-        medium_risk_count = 0
-        low_risk_count = 0
-        
-        for pattern in high_risk_patterns:
-            if pattern.lower() in content_lower:
-                high_risk_count += 1
-                logger.warning(f"High-risk pattern detected: {pattern}")
-        
-        for pattern in medium_risk_patterns:
-            if pattern.lower() in content_lower:
-                medium_risk_count += 1
-                logger.info(f"Medium-risk pattern detected: {pattern}")
-        
-        for pattern in low_risk_patterns:
-            if pattern.lower() in content_lower:
-                low_risk_count += 1
-                logger.debug(f"Low-risk pattern detected: {pattern}")
-        
-        # Scoring system for malicious intent
-        malicious_score = (high_risk_count * 3) + (medium_risk_count * 2) + (low_risk_count * 1)
+        # Scoring system for malicious intent: each tier adds its weight per matched pattern
+        malicious_score = 0
+        for label, patterns, weight, log_level in self.js_risk_tiers:
+            for pattern in patterns:
+                if pattern in content_lower:
+                    malicious_score += weight
+                    logger.log(log_level, f"{label} pattern detected: {pattern}")
         
         # Check for external domain access (additional risk factor)
-        external_domain_patterns = ['http://', 'https://', 'ftp://']
-        external_access = any(pattern in content_lower for pattern in external_domain_patterns)
+        external_access = any(pattern in content_lower for pattern in self.external_domain_patterns)
         if external_access:
             malicious_score += 2
             logger.warning("External domain access detected in JavaScript")
         
         # Require score of 6+ for malicious classification (prevents false positives)
         # This allows business PDFs with 1-2 low-risk patterns to pass
-        is_malicious = malicious_score >= 6
+        is_malicious = malicious_score >= self.js_malicious_score_threshold
         
         if is_malicious:
             logger.warning(f"JavaScript classified as malicious (score: {malicious_score})")
@@ -484,48 +777,26 @@ class SecurePDFValidator:
         
         return is_malicious
     
-    def _is_business_annotation(self, annot_obj, annot_str: str) -> bool:
+    def _is_business_annotation(self, annot_obj, annot_lower: str) -> bool:
         """
         Check if annotation is a legitimate business annotation type
         
         Args:
             annot_obj: PDF annotation object
-            annot_str: String representation of annotation
+            annot_lower: Lowercased string representation of annotation
             
         Returns:
             True if annotation appears to be legitimate business use
         """
-        # Safe business annotation types
-        safe_annotation_types = [
-            '/Text',      # Text annotations (comments, notes)
-            '/Highlight', # Text highlighting
-            '/Link',      # Hyperlinks (navigation)
-            '/FreeText',  # Free text annotations
-            '/Square',    # Rectangle annotations
-            '/Circle',    # Circle annotations
-            '/Line',      # Line annotations
-            '/Polygon',   # Polygon annotations
-            '/Ink',       # Freehand annotations
-            '/Stamp',     # Stamp annotations
-            '/Widget'     # Form widgets (fields, buttons)
-        ]
-        
         # Check annotation subtype
         subtype = str(annot_obj.get('/Subtype', ''))
-        for safe_type in safe_annotation_types:
+        for safe_type in self.safe_annotation_types:
             if safe_type in subtype:
                 logger.debug(f"Safe business annotation type detected: {safe_type}")
                 return True
         
         # Check for business domain whitelist in URLs
-        business_domains = [
-            'microsoft.com', 'office.com', 'adobe.com', 'google.com',
-            'salesforce.com', 'quickbooks.com', 'xero.com', 'sage.com',
-            'dropbox.com', 'box.com', 'sharepoint.com'
-        ]
-        
-        annot_lower = annot_str.lower()
-        for domain in business_domains:
+        for domain in self.business_domains:
             if domain in annot_lower:
                 logger.debug(f"Business domain detected in annotation: {domain}")
                 return True
@@ -555,22 +826,22 @@ class SecurePDFValidator:
                             if annot and hasattr(annot, 'get_object'):
                                 annot_obj = annot.get_object()
                                 annot_str = str(annot_obj)
+                                annot_lower = annot_str.lower()
                                 
                                 # First check if this is a business annotation
-                                if self._is_business_annotation(annot_obj, annot_str):
+                                if self._is_business_annotation(annot_obj, annot_lower):
                                     safe_annotations_count += 1
                                     logger.debug(f"Business annotation allowed on page {page_num + 1}")
                                     continue
                                 
                                 # Check for dangerous JavaScript in annotations - be very specific
-                                if ('/JavaScript' in annot_str or '/JS' in annot_str):
-                                    if self._contains_actual_javascript(annot_str):
-                                        # Double check for TRULY dangerous JS patterns
-                                        if self._is_truly_malicious_javascript(annot_str):
-                                            dangerous_annotations.append(f"Malicious JavaScript in annotation on page {page_num + 1}")
-                                            logger.warning(f"Malicious JavaScript-enabled annotation detected on page {page_num + 1}")
-                                        else:
-                                            logger.info(f"JavaScript reference in annotation appears safe on page {page_num + 1}")
+                                if self._js_reference_re.search(annot_str):
+                                    verdict = self._classify_javascript(annot_lower)
+                                    if verdict is JsVerdict.MALICIOUS:
+                                        dangerous_annotations.append(f"Malicious JavaScript in annotation on page {page_num + 1}")
+                                        logger.warning(f"Malicious JavaScript-enabled annotation detected on page {page_num + 1}")
+                                    elif verdict is JsVerdict.SUSPICIOUS:
+                                        logger.info(f"JavaScript reference in annotation appears safe on page {page_num + 1}")
                                     else:
                                         logger.debug(f"Form field JavaScript reference on page {page_num + 1} - safe")
                                 
@@ -580,8 +851,8 @@ class SecurePDFValidator:
                                     # Only flag Launch actions that execute external commands with dangerous extensions
                                     dangerous_extensions = ['.exe', '.bat', '.cmd', '.scr', '.com', '.pif']
                                     if '/Launch' in subtype:
-                                        has_dangerous_extension = any(ext in annot_str.lower() for ext in dangerous_extensions)
-                                        has_system_command = any(cmd in annot_str.lower() for cmd in ['cmd.exe', 'powershell', 'wscript'])
+                                        has_dangerous_extension = any(ext in annot_lower for ext in dangerous_extensions)
+                                        has_system_command = any(cmd in annot_lower for cmd in ['cmd.exe', 'powershell', 'wscript'])
                                         
                                         if has_dangerous_extension or has_system_command:
                                             dangerous_annotations.append(f"Executable launch annotation on page {page_num + 1}")
@@ -615,10 +886,14 @@ class SecurePDFValidator:
             if len(pdf_reader.pages) > 0:
                 try:
                     first_page = pdf_reader.pages[0]
-                    # Try to extract text to validate page structure
-                    text = first_page.extract_text()
-                    if text is None:
-                        warnings.append("Could not extract text from first page")
+                    # Decode the content stream(s) to validate page structure. This
+                    # exercises the same filters as text extraction without running
+                    # pypdf's pure-Python text layout, which pdfplumber redoes later anyway.
+                    if '/Contents' in first_page:
+                        contents = first_page['/Contents']
+                        streams = contents if isinstance(contents, ArrayObject) else [contents]
+                        for stream in streams:
+                            stream.get_object().get_data()
                 except Exception as e:
                     warnings.append(f"Could not read first page: {e}")
         
@@ -629,19 +904,20 @@ class SecurePDFValidator:
     
     def _extract_safe_metadata(self, metadata) -> Dict[str, str]:
         """Extract safe metadata fields only"""
-        safe_fields = ['/Title', '/Author', '/Subject', '/Creator', '/Producer', '/CreationDate', '/ModDate']
         safe_metadata = {}
         
-        for field in safe_fields:
-            if field in metadata:
-                try:
-                    value = str(metadata[field])
-                    # Truncate long values
-                    if len(value) > 200:
-                        value = value[:200] + "..."
-                    safe_metadata[field.lstrip('/')] = value
-                except Exception:
-                    continue
+        # One pass over the entries; each value is resolved at most once
+        for field, value in metadata.items():
+            if field not in self.safe_metadata_fields:
+                continue
+            try:
+                value = str(value.get_object() if hasattr(value, 'get_object') else value)
+                # Truncate long values
+                if len(value) > 200:
+                    value = value[:200] + "..."
+                safe_metadata[field.lstrip('/')] = value
+            except Exception:
+                continue
         
         return safe_metadata
     
@@ -657,9 +933,15 @@ class SecurePDFValidator:
         """
         try:
             with open(file_path, 'rb') as f:
+                # file_digest (3.11+) hashes from the raw fd in C with the GIL released
+                if hasattr(hashlib, 'file_digest'):
+                    return hashlib.file_digest(f, 'sha256').hexdigest()
+                
                 file_hash = hashlib.sha256()
-                for chunk in iter(lambda: f.read(4096), b""):
-                    file_hash.update(chunk)
+                # Hash the mapped pages directly instead of copying 4 KB chunks through Python
+                if os.fstat(f.fileno()).st_size > 0:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as file_map:
+                        file_hash.update(file_map)
                 return file_hash.hexdigest()
         except Exception as e:
             logger.error(f"Could not calculate file hash: {e}")
@@ -13,25 +13,77 @@ This suite implements:
 
 import asyncio
 import aiohttp
+import csv
 import time
 import threading
 import psutil
 import statistics
+import numpy as np
 import json
+import math
 import os
 import sys
-from dataclasses import dataclass, asdict
-from typing import List, Dict, Any, Optional
+from array import array
+from dataclasses import dataclass, asdict, fields
+from typing import List, Dict, Any, Optional, Tuple
 from pathlib import Path
 from datetime import datetime
 import concurrent.futures
 import tempfile
 import logging
+import uuid
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+# Response bodies are decoded with orjson when available
+_json_loads = orjson.loads if HAS_ORJSON else json.loads
+
+# libuv-based event loop for the driver (not available on Windows)
+try:
+    import uvloop
+    HAS_UVLOOP = True
+except ImportError:
+    HAS_UVLOOP = False
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Minimal one-page PDFs posted by the load test and the cleanup check
+_TEST_PDF = b"""%PDF-1.4
+1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj
+2 0 obj<</Type/Pages/Kids[3 0 R]/Count 1>>endobj
+3 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 612 792]/Contents 4 0 R>>endobj
+4 0 obj<</Length 44>>stream
+BT /F1 12 Tf 100 700 Td (Test Table Data) Tj ET
+endstream endobj
+xref 0 5
+0000000000 65535 f 
+0000000010 00000 n 
+0000000053 00000 n 
+0000000125 00000 n 
+0000000237 00000 n 
+trailer<</Size 5/Root 1 0 R>>
+startxref 330
+%%EOF"""
+
+_CLEANUP_PDF = b"""%PDF-1.4
+1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj
+2 0 obj<</Type/Pages/Kids[3 0 R]/Count 1>>endobj
+3 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 612 792]>>endobj
+xref 0 4
+0000000000 65535 f
+0000000010 00000 n
+0000000053 00000 n
+0000000109 00000 n
+trailer<</Size 4/Root 1 0 R>>
+startxref 178
+%%EOF"""
+
 @dataclass
 class PerformanceMetrics:
     """Comprehensive performance metrics"""
@@ -50,6 +102,8 @@ class PerformanceMetrics:
     avg_memory_usage: float = 0.0
     max_memory_usage: float = 0.0
     memory_growth: float = 0.0
+    server_avg_cpu: float = 0.0  # % of one core, when a server PID is monitored
+    server_rss_mb: float = 0.0  # Peak resident memory of the server process
     test_duration: float = 0.0
     errors: List[str] = None
     bottlenecks_identified: List[str] = None
@@ -60,6 +114,80 @@ class PerformanceMetrics:
         if self.bottlenecks_identified is None:
             self.bottlenecks_identified = []
 
+def _encode_multipart(pdf: bytes, filename: str, export_format: str) -> Tuple[bytes, str]:
+    """Encode an /extract upload form once; returns the body and its Content-Type"""
+    boundary = uuid.uuid4().hex
+    body = b"".join([
+        (f'--{boundary}\r\n'
+         f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+         'Content-Type: application/pdf\r\n\r\n').encode(),
+        pdf,
+        (f'\r\n--{boundary}\r\n'
+         'Content-Disposition: form-data; name="export_format"\r\n\r\n'
+         f'{export_format}\r\n'
+         f'--{boundary}--\r\n').encode(),
+    ])
+    return body, f"multipart/form-data; boundary={boundary}"
+
+@dataclass(slots=True, frozen=True)
+class RequestResult:
+    """Outcome of one load-test request (slotted: thousands are kept per run)"""
+    user_id: int
+    request_id: int
+    endpoint: str
+    status_code: int
+    response_time_ns: int
+    success: bool
+    rate_limited: bool
+    content_length: int
+    timestamp: float
+    error: Optional[str] = None
+
+class ResultColumns:
+    """
+    Per-request results of a run, kept column-wise in compact typed arrays
+    
+    Each RequestResult is folded in as it arrives and then dropped, so a long run
+    holds a few bytes per request instead of a Python object each. Rows are also
+    streamed to a CSV file when a path is given, for offline analysis.
+    """
+    RAW_FIELDS = [f.name for f in fields(RequestResult)]
+    
+    def __init__(self, raw_path: Optional[str] = None):
+        self.response_time_ns = array('q')
+        self.success = array('b')
+        self.rate_limited = array('b')
+        self.endpoint_index = array('i')
+        self.endpoint_ids: Dict[str, int] = {}  # Endpoint -> index, in first-seen order
+        self.errors: List[str] = []
+        self.raw_file = None
+        self.raw_writer = None
+        if raw_path:
+            self.raw_file = open(raw_path, 'w', newline='', buffering=1 << 20)
+            self.raw_writer = csv.writer(self.raw_file)
+            self.raw_writer.writerow(self.RAW_FIELDS)
+    
+    def __len__(self) -> int:
+        return len(self.response_time_ns)
+    
+    def append(self, result: RequestResult):
+        """Record one request's outcome"""
+        self.response_time_ns.append(result.response_time_ns)
+        self.success.append(result.success)
+        self.rate_limited.append(result.rate_limited)
+        self.endpoint_index.append(self.endpoint_ids.setdefault(result.endpoint, len(self.endpoint_ids)))
+        if result.error:
+            self.errors.append(result.error)
+        if self.raw_writer is not None:
+            self.raw_writer.writerow([getattr(result, name) for name in self.RAW_FIELDS])
+    
+    def close(self):
+        """Flush and close the raw CSV stream, if any"""
+        if self.raw_file is not None:
+            self.raw_file.close()
+            self.raw_file = None
+            self.raw_writer = None
+
 @dataclass
 class TestConfiguration:
     """Test configuration parameters"""
@@ -68,39 +196,75 @@ class TestConfiguration:
     requests_per_user: int = 10
     test_duration: int = 60  # seconds
     ramp_up_time: int = 10   # seconds to reach target concurrency
-    endpoints_to_test: List[str] = None
+    endpoints_to_test: Tuple[str, ...] = ("/health", "/", "/security/status")
     pdf_test_enabled: bool = True
     cleanup_verification: bool = True
-    
-    def __post_init__(self):
-        if self.endpoints_to_test is None:
-            self.endpoints_to_test = ["/health", "/", "/security/status"]
+    max_requests_per_second: Optional[float] = None  # Client-side cap across all users; None = unthrottled
+    server_pid: Optional[int] = None  # Server process to sample CPU/RSS for, alongside system-wide usage
+    raw_results_path: Optional[str] = None  # CSV file to stream per-request rows to
+
+# Run-level bottleneck checks, in report order: (value, limit, True when exceeding
+# the limit is bad / False when falling below it is, message)
+BOTTLENECK_THRESHOLDS = [
+    ("avg_response_time", 2000, True, "High average response time: {:.2f}ms"),
+    ("p95_response_time", 5000, True, "High P95 response time: {:.2f}ms"),
+    ("failure_rate", 5, True, "High failure rate: {:.1f}%"),
+    ("avg_cpu_usage", 80, True, "High CPU usage: {:.1f}%"),
+    ("server_avg_cpu", 80, True, "High server process CPU usage: {:.1f}% of a core"),
+    ("avg_memory_usage", 85, True, "High memory usage: {:.1f}%"),
+    ("memory_growth", 10, True, "Significant memory growth: {:.1f}%"),
+    ("requests_per_second", 10, False, "Low throughput: {:.1f} req/s"),
+    # More than 30% rate limited might indicate too aggressive limits
+    ("rate_limit_rate", 30, True, "Excessive rate limiting: {:.1f}%"),
+]
 
 class SystemMonitor:
     """Monitor system resources during testing"""
     
-    def __init__(self):
+    def __init__(self, server_pid: Optional[int] = None):
         self.monitoring = False
         self.cpu_samples = []
         self.memory_samples = []
         self.initial_memory = 0
         self.monitor_thread = None
+        self.server_pid = server_pid
+        self.server_cpu_samples = []
+        self.server_rss_samples = []
         
     def start_monitoring(self):
         """Start system monitoring"""
         self.monitoring = True
         self.cpu_samples = []
         self.memory_samples = []
+        self.server_cpu_samples = []
+        self.server_rss_samples = []
         self.initial_memory = psutil.virtual_memory().percent
         
+        # System-wide CPU is diluted across cores and includes other processes;
+        # the server process's own usage says whether the server is CPU-bound
+        server = None
+        if self.server_pid is not None:
+            try:
+                server = psutil.Process(self.server_pid)
+            except psutil.Error as e:
+                logger.warning(f"Cannot monitor server process {self.server_pid}: {e}")
+        
         def monitor_resources():
+            # Non-blocking CPU sampling: each call reports usage since the previous one,
+            # so the first call only sets the baseline and the sleep sets the cadence
+            psutil.cpu_percent(interval=None)
+            if server is not None:
+                server.cpu_percent(interval=None)
             while self.monitoring:
+                time.sleep(0.5)
                 try:
-                    cpu = psutil.cpu_percent(interval=0.1)
+                    cpu = psutil.cpu_percent(interval=None)
                     memory = psutil.virtual_memory().percent
                     self.cpu_samples.append(cpu)
                     self.memory_samples.append(memory)
-                    time.sleep(0.5)
+                    if server is not None:
+                        self.server_cpu_samples.append(server.cpu_percent(interval=None))
+                        self.server_rss_samples.append(server.memory_info().rss)
                 except Exception as e:
                     logger.warning(f"Monitoring error: {e}")
                     break
@@ -115,146 +279,245 @@ class SystemMonitor:
         if self.monitor_thread:
             self.monitor_thread.join(timeout=2)
         
+        # Keys match the PerformanceMetrics fields they are passed into
+        server_metrics = {}
+        if self.server_cpu_samples:
+            server_metrics = {
+                "server_avg_cpu": statistics.mean(self.server_cpu_samples),
+                "server_rss_mb": max(self.server_rss_samples) / 1024 / 1024
+            }
+        
         if not self.cpu_samples or not self.memory_samples:
             return {
-                "avg_cpu": 0, "max_cpu": 0,
-                "avg_memory": 0, "max_memory": 0, "memory_growth": 0
+                "avg_cpu_usage": 0, "max_cpu_usage": 0,
+                "avg_memory_usage": 0, "max_memory_usage": 0, "memory_growth": 0
             }
         
         return {
-            "avg_cpu": statistics.mean(self.cpu_samples),
-            "max_cpu": max(self.cpu_samples),
-            "avg_memory": statistics.mean(self.memory_samples),
-            "max_memory": max(self.memory_samples),
-            "memory_growth": max(self.memory_samples) - self.initial_memory
+            "avg_cpu_usage": statistics.mean(self.cpu_samples),
+            "max_cpu_usage": max(self.cpu_samples),
+            "avg_memory_usage": statistics.mean(self.memory_samples),
+            "max_memory_usage": max(self.memory_samples),
+            "memory_growth": max(self.memory_samples) - self.initial_memory,
+            **server_metrics
         }
 
+class AsyncTokenBucket:
+    """
+    Client-side rate limiter shared by all simulated users
+    
+    A token bucket refilled at `rate` tokens per second (no limit when rate is None),
+    plus a pause the server can impose through 429 responses.
+    """
+    
+    def __init__(self, rate: Optional[float], burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+    
+    async def acquire(self):
+        """Wait for a token (and for any server-imposed pause to pass)"""
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                if self.rate is None:
+                    return
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+    
+    def penalize(self, delay: float):
+        """Hold every user back for `delay` seconds"""
+        self.paused_until = max(self.paused_until, time.monotonic() + delay)
+
+class LatencyHistogram:
+    """
+    Constant-memory latency histogram (HdrHistogram-style)
+    
+    Values in nanoseconds are bucketed by power of two, and each power-of-two range
+    is split into SUB_BUCKETS linear sub-buckets, so a percentile is resolved to
+    within 1/SUB_BUCKETS of its magnitude no matter how many values are recorded.
+    """
+    MAGNITUDES = 64
+    SUB_BUCKETS = 16
+    
+    def __init__(self):
+        self.counts = [0] * (self.MAGNITUDES * self.SUB_BUCKETS)
+        self.total_count = 0
+        self.min_ns = None
+        self.max_ns = 0
+    
+    def record(self, ns: int):
+        """Count one latency sample"""
+        ns = max(1, int(ns))
+        magnitude = min(ns.bit_length() - 1, self.MAGNITUDES - 1)
+        sub_bucket = min(((ns - (1 << magnitude)) * self.SUB_BUCKETS) >> magnitude, self.SUB_BUCKETS - 1)
+        self.counts[magnitude * self.SUB_BUCKETS + sub_bucket] += 1
+        self.total_count += 1
+        self.min_ns = ns if self.min_ns is None else min(self.min_ns, ns)
+        self.max_ns = max(self.max_ns, ns)
+    
+    def _bucket_upper_ns(self, index: int) -> int:
+        """Upper edge of a bucket, in nanoseconds"""
+        magnitude, sub_bucket = divmod(index, self.SUB_BUCKETS)
+        return (1 << magnitude) + (((sub_bucket + 1) << magnitude) // self.SUB_BUCKETS)
+    
+    def percentile_ns(self, percent: float) -> int:
+        """Value at or below which `percent` of the samples fall, from cumulative bucket counts"""
+        if not self.total_count:
+            return 0
+        target = max(1, math.ceil(self.total_count * percent / 100))
+        running = 0
+        for index, count in enumerate(self.counts):
+            running += count
+            if running >= target:
+                return max(self.min_ns, min(self._bucket_upper_ns(index), self.max_ns))
+        return self.max_ns
+
 class LoadTester:
     """Advanced load testing framework"""
     
-    def __init__(self, config: TestConfiguration):
+    # Below this many timed requests percentiles are computed exactly
+    exact_percentile_limit = 10_000
+    
+    def __init__(self, config: TestConfiguration, session: aiohttp.ClientSession):
         self.config = config
-        self.monitor = SystemMonitor()
-        self.results = []
-        self.session = None
-        
-    async def create_session(self):
-        """Create aiohttp session with appropriate settings"""
-        timeout = aiohttp.ClientTimeout(total=60, connect=10)
-        connector = aiohttp.TCPConnector(
-            limit=self.config.concurrent_users * 2,
-            limit_per_host=self.config.concurrent_users,
-            keepalive_timeout=30
-        )
-        self.session = aiohttp.ClientSession(
-            timeout=timeout,
-            connector=connector,
-            headers={"User-Agent": "PDFTablePro-LoadTester/1.0"}
-        )
+        self.monitor = SystemMonitor(config.server_pid)
+        self.results = ResultColumns()
+        # Latencies of the current run; percentiles come from here on long runs
+        self.histogram = LatencyHistogram()
+        # Shared with the rest of the suite so pooled connections survive between levels
+        self.session = session
+        self.bucket = AsyncTokenBucket(config.max_requests_per_second, burst=config.concurrent_users)
+        self.rate_limit_streak = 0  # Consecutive 429s, for exponential back-off
+        # Encoded upload form per user, built on the user's first PDF request
+        self.pdf_bodies: Dict[int, Tuple[bytes, str]] = {}
+    
+    def _retry_delay(self, headers) -> float:
+        """Seconds to back off after a 429: the server's hint if given, else exponential"""
+        for header in ("Retry-After", "X-RateLimit-Reset"):
+            value = headers.get(header)
+            try:
+                delay = float(value)
+            except (TypeError, ValueError):
+                continue
+            # X-RateLimit-Reset may be an epoch timestamp rather than a delay
+            if delay > 1e9:
+                delay -= time.time()
+            return max(0.0, delay)
+        return min(30.0, 0.5 * 2 ** (self.rate_limit_streak - 1))
+    
+    def _track_rate_limit(self, response):
+        """Back all users off on 429 and reset the back-off on any other status"""
+        if response.status == 429:
+            self.rate_limit_streak += 1
+            self.bucket.penalize(self._retry_delay(response.headers))
+        else:
+            self.rate_limit_streak = 0
         
-    async def close_session(self):
-        """Close aiohttp session"""
-        if self.session:
-            await self.session.close()
-            
-    async def make_request(self, endpoint: str, user_id: int, request_id: int) -> Dict[str, Any]:
+    async def make_request(self, endpoint: str, user_id: int, request_id: int) -> RequestResult:
         """Make a single HTTP request and measure performance"""
         start_time = time.time()
+        t0 = time.perf_counter_ns()
         
         try:
             url = f"{self.config.base_url}{endpoint}"
             async with self.session.get(url) as response:
-                content = await response.text()
-                end_time = time.time()
+                # Only the size is used: read raw bytes without decoding. The body is still
+                # read in full so the connection returns to the pool and the timing covers it
+                content = await response.read()
+                response_time_ns = time.perf_counter_ns() - t0
+                self.histogram.record(response_time_ns)
+                self._track_rate_limit(response)
                 
-                return {
-                    "user_id": user_id,
-                    "request_id": request_id,
-                    "endpoint": endpoint,
-                    "status_code": response.status,
-                    "response_time": (end_time - start_time) * 1000,  # ms
-                    "success": 200 <= response.status < 300,
-                    "rate_limited": response.status == 429,
-                    "content_length": len(content),
-                    "timestamp": start_time
-                }
+                return RequestResult(
+                    user_id=user_id,
+                    request_id=request_id,
+                    endpoint=endpoint,
+                    status_code=response.status,
+                    response_time_ns=response_time_ns,
+                    success=200 <= response.status < 300,
+                    rate_limited=response.status == 429,
+                    content_length=len(content),
+                    timestamp=start_time
+                )
                 
         except asyncio.TimeoutError:
-            return {
-                "user_id": user_id, "request_id": request_id, "endpoint": endpoint,
-                "status_code": 408, "response_time": 60000, "success": False,
-                "rate_limited": False, "content_length": 0, "timestamp": start_time,
-                "error": "Request timeout"
-            }
+            # Failed requests count towards the percentiles, as they do on the exact path
+            self.histogram.record(60_000_000_000)
+            return RequestResult(
+                user_id=user_id, request_id=request_id, endpoint=endpoint,
+                status_code=408, response_time_ns=60_000_000_000, success=False,
+                rate_limited=False, content_length=0, timestamp=start_time,
+                error="Request timeout"
+            )
         except Exception as e:
-            return {
-                "user_id": user_id, "request_id": request_id, "endpoint": endpoint,
-                "status_code": 500, "response_time": (time.time() - start_time) * 1000,
-                "success": False, "rate_limited": False, "content_length": 0,
-                "timestamp": start_time, "error": str(e)
-            }
+            response_time_ns = time.perf_counter_ns() - t0
+            self.histogram.record(response_time_ns)
+            return RequestResult(
+                user_id=user_id, request_id=request_id, endpoint=endpoint,
+                status_code=500, response_time_ns=response_time_ns,
+                success=False, rate_limited=False, content_length=0,
+                timestamp=start_time, error=str(e)
+            )
     
-    async def make_pdf_request(self, user_id: int, request_id: int) -> Dict[str, Any]:
+    async def make_pdf_request(self, user_id: int, request_id: int) -> RequestResult:
         """Make a PDF extraction request"""
         start_time = time.time()
-        
-        # Create test PDF content
-        pdf_content = b"""%PDF-1.4
-1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj
-2 0 obj<</Type/Pages/Kids[3 0 R]/Count 1>>endobj
-3 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 612 792]/Contents 4 0 R>>endobj
-4 0 obj<</Length 44>>stream
-BT /F1 12 Tf 100 700 Td (Test Table Data) Tj ET
-endstream endobj
-xref 0 5
-0000000000 65535 f 
-0000000010 00000 n 
-0000000053 00000 n 
-0000000125 00000 n 
-0000000237 00000 n 
-trailer<</Size 5/Root 1 0 R>>
-startxref 330
-%%EOF"""
+        t0 = time.perf_counter_ns()
         
         try:
             url = f"{self.config.base_url}/extract"
-            data = aiohttp.FormData()
-            data.add_field('file', pdf_content, 
-                          filename=f'test_{user_id}_{request_id}.pdf',
-                          content_type='application/pdf')
-            data.add_field('export_format', 'csv')
+            if user_id not in self.pdf_bodies:
+                self.pdf_bodies[user_id] = _encode_multipart(_TEST_PDF, f'test_{user_id}.pdf', 'csv')
+            body, content_type = self.pdf_bodies[user_id]
             
-            async with self.session.post(url, data=data) as response:
-                content = await response.text()
-                end_time = time.time()
+            async with self.session.post(url, data=body, headers={"Content-Type": content_type}) as response:
+                content = await response.read()
+                response_time_ns = time.perf_counter_ns() - t0
+                self.histogram.record(response_time_ns)
+                self._track_rate_limit(response)
                 
-                return {
-                    "user_id": user_id, "request_id": request_id, "endpoint": "/extract",
-                    "status_code": response.status, "response_time": (end_time - start_time) * 1000,
-                    "success": 200 <= response.status < 300, "rate_limited": response.status == 429,
-                    "content_length": len(content), "timestamp": start_time
-                }
+                return RequestResult(
+                    user_id=user_id, request_id=request_id, endpoint="/extract",
+                    status_code=response.status, response_time_ns=response_time_ns,
+                    success=200 <= response.status < 300, rate_limited=response.status == 429,
+                    content_length=len(content), timestamp=start_time
+                )
                 
         except Exception as e:
-            return {
-                "user_id": user_id, "request_id": request_id, "endpoint": "/extract",
-                "status_code": 500, "response_time": (time.time() - start_time) * 1000,
-                "success": False, "rate_limited": False, "content_length": 0,
-                "timestamp": start_time, "error": str(e)
-            }
+            response_time_ns = time.perf_counter_ns() - t0
+            self.histogram.record(response_time_ns)
+            return RequestResult(
+                user_id=user_id, request_id=request_id, endpoint="/extract",
+                status_code=500, response_time_ns=response_time_ns,
+                success=False, rate_limited=False, content_length=0,
+                timestamp=start_time, error=str(e)
+            )
     
-    async def simulate_user(self, user_id: int, delay_start: float = 0) -> List[Dict[str, Any]]:
-        """Simulate a single user making requests"""
+    async def simulate_user(self, user_id: int, delay_start: float = 0):
+        """Simulate a single user making requests, recording each result into self.results"""
         # Stagger user start times for ramp-up
         if delay_start > 0:
             await asyncio.sleep(delay_start)
         
-        user_results = []
-        endpoints_cycle = self.config.endpoints_to_test.copy()
+        endpoints = self.config.endpoints_to_test
         
         for request_id in range(self.config.requests_per_user):
+            # Pace through the shared limiter rather than a fixed per-user sleep
+            await self.bucket.acquire()
+            
             # Alternate between different endpoints
-            endpoint = endpoints_cycle[request_id % len(endpoints_cycle)]
+            endpoint = endpoints[request_id % len(endpoints)]
             
             # Mix in PDF requests if enabled
             if self.config.pdf_test_enabled and request_id % 5 == 0 and request_id > 0:
@@ -262,19 +525,24 @@ startxref 330
             else:
                 result = await self.make_request(endpoint, user_id, request_id)
             
-            user_results.append(result)
-            
-            # Small delay between requests from same user
-            await asyncio.sleep(0.1)
-        
-        return user_results
+            self.results.append(result)
+    
+    async def _run_user(self, user_id: int):
+        """Simulate a user, logging a failure instead of cancelling the other users"""
+        try:
+            await self.simulate_user(user_id)
+        except Exception as e:
+            logger.error(f"User simulation error: {e}")
     
     async def run_load_test(self) -> PerformanceMetrics:
         """Run comprehensive load test"""
         logger.info(f"Starting load test: {self.config.concurrent_users} users, "
                    f"{self.config.requests_per_user} requests each")
         
-        await self.create_session()
+        self.histogram = LatencyHistogram()
+        self.bucket = AsyncTokenBucket(self.config.max_requests_per_second, burst=self.config.concurrent_users)
+        self.rate_limit_streak = 0
+        self.results = ResultColumns(self.config.raw_results_path)
         self.monitor.start_monitoring()
         
         start_time = time.time()
@@ -283,206 +551,173 @@ startxref 330
         ramp_delay = self.config.ramp_up_time / self.config.concurrent_users
         
         try:
-            # Launch all users with staggered start times
-            tasks = []
-            for user_id in range(self.config.concurrent_users):
-                delay = user_id * ramp_delay
-                task = asyncio.create_task(self.simulate_user(user_id, delay))
-                tasks.append(task)
-            
-            # Wait for all users to complete
-            user_results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            # Flatten results
-            all_results = []
-            for user_result in user_results:
-                if isinstance(user_result, list):
-                    all_results.extend(user_result)
-                else:
-                    logger.error(f"User simulation error: {user_result}")
-            
-            self.results = all_results
+            # One driver starts users on a schedule measured from a single start
+            # time, instead of every user task parking on its own ramp-up timer
+            loop = asyncio.get_running_loop()
+            async with asyncio.TaskGroup() as tg:
+                ramp_start = loop.time()
+                for user_id in range(self.config.concurrent_users):
+                    await asyncio.sleep(max(0.0, ramp_start + user_id * ramp_delay - loop.time()))
+                    tg.create_task(self._run_user(user_id))
             
         except Exception as e:
             logger.error(f"Load test error: {e}")
         finally:
             end_time = time.time()
             system_metrics = self.monitor.stop_monitoring()
-            await self.close_session()
+            self.results.close()
         
-        # Calculate performance metrics
-        return self.calculate_metrics(all_results, system_metrics, end_time - start_time)
+        # Calculate performance metrics in a worker thread so the loop stays free
+        return await asyncio.to_thread(self.calculate_metrics, self.results, system_metrics, end_time - start_time)
     
-    def calculate_metrics(self, results: List[Dict], system_metrics: Dict, duration: float) -> PerformanceMetrics:
+    def calculate_metrics(self, results: ResultColumns, system_metrics: Dict, duration: float) -> PerformanceMetrics:
         """Calculate comprehensive performance metrics"""
-        if not results:
+        if not len(results):
             return PerformanceMetrics(test_duration=duration)
         
-        response_times = [r["response_time"] for r in results if "response_time" in r]
-        successful = [r for r in results if r.get("success", False)]
-        rate_limited = [r for r in results if r.get("rate_limited", False)]
-        errors = [r for r in results if r.get("error")]
+        # The result columns are viewed as arrays without copying; everything below is vectorized
+        count = len(results)
+        response_times_ns = np.frombuffer(results.response_time_ns, dtype=np.int64)
+        successful = np.frombuffer(results.success, dtype=np.int8).astype(bool)
+        rate_limited = np.frombuffer(results.rate_limited, dtype=np.int8).astype(bool)
         
+        successful_count = int(successful.sum())
         metrics = PerformanceMetrics(
-            request_count=len(results),
-            successful_requests=len(successful),
-            failed_requests=len(results) - len(successful),
-            rate_limited_requests=len(rate_limited),
+            request_count=count,
+            successful_requests=successful_count,
+            failed_requests=count - successful_count,
+            rate_limited_requests=int(rate_limited.sum()),
             test_duration=duration,
-            requests_per_second=len(results) / duration if duration > 0 else 0,
+            requests_per_second=count / duration if duration > 0 else 0,
             **system_metrics
         )
         
-        if response_times:
-            metrics.avg_response_time = statistics.mean(response_times)
-            metrics.max_response_time = max(response_times)
-            metrics.min_response_time = min(response_times)
+        # Timings stay in integer nanoseconds until here; metrics are reported in ms
+        response_times = response_times_ns / 1e6
+        if response_times.size:
+            metrics.avg_response_time = float(response_times.mean())
+            metrics.max_response_time = float(response_times.max())
+            metrics.min_response_time = float(response_times.min())
             
-            sorted_times = sorted(response_times)
-            metrics.p95_response_time = sorted_times[int(0.95 * len(sorted_times))]
-            metrics.p99_response_time = sorted_times[int(0.99 * len(sorted_times))]
+            if response_times.size < self.exact_percentile_limit:
+                p95, p99 = np.percentile(response_times, [95, 99], method="linear")
+            else:
+                # Long runs: read percentiles off the histogram instead of sorting
+                p95, p99 = (self.histogram.percentile_ns(p) / 1e6 for p in (95, 99))
+            metrics.p95_response_time = float(p95)
+            metrics.p99_response_time = float(p99)
         
         # Collect errors
-        metrics.errors = [r.get("error", "Unknown error") for r in errors]
+        metrics.errors = list(results.errors)
         
         # Identify bottlenecks
         metrics.bottlenecks_identified = self.identify_bottlenecks(metrics, results)
         
         return metrics
     
-    def identify_bottlenecks(self, metrics: PerformanceMetrics, results: List[Dict]) -> List[str]:
+    def identify_bottlenecks(self, metrics: PerformanceMetrics, results: ResultColumns) -> List[str]:
         """Identify performance bottlenecks"""
         bottlenecks = []
         
-        # High response times
-        if metrics.avg_response_time > 2000:
-            bottlenecks.append(f"High average response time: {metrics.avg_response_time:.2f}ms")
-        
-        if metrics.p95_response_time > 5000:
-            bottlenecks.append(f"High P95 response time: {metrics.p95_response_time:.2f}ms")
-        
-        # High failure rate
-        failure_rate = metrics.failed_requests / metrics.request_count * 100
-        if failure_rate > 5:
-            bottlenecks.append(f"High failure rate: {failure_rate:.1f}%")
-        
-        # High CPU usage
-        if metrics.avg_cpu_usage > 80:
-            bottlenecks.append(f"High CPU usage: {metrics.avg_cpu_usage:.1f}%")
-        
-        # High memory usage
-        if metrics.avg_memory_usage > 85:
-            bottlenecks.append(f"High memory usage: {metrics.avg_memory_usage:.1f}%")
-        
-        # Memory growth
-        if metrics.memory_growth > 10:
-            bottlenecks.append(f"Significant memory growth: {metrics.memory_growth:.1f}%")
-        
-        # Low throughput
-        if metrics.requests_per_second < 10 and self.config.concurrent_users >= 10:
-            bottlenecks.append(f"Low throughput: {metrics.requests_per_second:.1f} req/s")
-        
-        # Rate limiting issues
-        rate_limit_rate = metrics.rate_limited_requests / metrics.request_count * 100
-        if rate_limit_rate > 30:  # More than 30% rate limited might indicate too aggressive limits
-            bottlenecks.append(f"Excessive rate limiting: {rate_limit_rate:.1f}%")
-        
-        # Analyze endpoint-specific issues
-        endpoint_stats = {}
-        for result in results:
-            endpoint = result.get("endpoint", "unknown")
-            if endpoint not in endpoint_stats:
-                endpoint_stats[endpoint] = {"count": 0, "errors": 0, "total_time": 0}
-            
-            endpoint_stats[endpoint]["count"] += 1
-            if not result.get("success", False):
-                endpoint_stats[endpoint]["errors"] += 1
-            endpoint_stats[endpoint]["total_time"] += result.get("response_time", 0)
-        
-        for endpoint, stats in endpoint_stats.items():
-            error_rate = stats["errors"] / stats["count"] * 100
-            avg_time = stats["total_time"] / stats["count"]
-            
-            if error_rate > 10:
-                bottlenecks.append(f"High error rate on {endpoint}: {error_rate:.1f}%")
-            if avg_time > 3000:
-                bottlenecks.append(f"Slow response on {endpoint}: {avg_time:.2f}ms")
+        # Rates are guarded so an empty run still gets a report
+        request_count = max(metrics.request_count, 1)
+        values = {
+            "avg_response_time": metrics.avg_response_time,
+            "p95_response_time": metrics.p95_response_time,
+            "failure_rate": metrics.failed_requests / request_count * 100,
+            "avg_cpu_usage": metrics.avg_cpu_usage,
+            "server_avg_cpu": metrics.server_avg_cpu if self.config.server_pid is not None else None,
+            "avg_memory_usage": metrics.avg_memory_usage,
+            "memory_growth": metrics.memory_growth,
+            # Throughput only means something with at least 10 users
+            "requests_per_second": metrics.requests_per_second if self.config.concurrent_users >= 10 else None,
+            "rate_limit_rate": metrics.rate_limited_requests / request_count * 100,
+        }
+        for key, limit, above, message in BOTTLENECK_THRESHOLDS:
+            value = values[key]
+            if value is not None and (value > limit if above else value < limit):
+                bottlenecks.append(message.format(value))
+        
+        # Analyze endpoint-specific issues: endpoints carry integer ids in first-seen
+        # order, so per-endpoint counts, errors and times are summed with bincount
+        endpoint_ids = results.endpoint_ids
+        endpoint_index = np.frombuffer(results.endpoint_index, dtype=np.int32).astype(np.intp)
+        failed = np.frombuffer(results.success, dtype=np.int8) == 0
+        response_ms = np.frombuffer(results.response_time_ns, dtype=np.int64) / 1e6
+        
+        n_endpoints = len(endpoint_ids)
+        counts = np.bincount(endpoint_index, minlength=n_endpoints)
+        error_rates = np.bincount(endpoint_index, weights=failed, minlength=n_endpoints) / counts * 100
+        avg_times = np.bincount(endpoint_index, weights=response_ms, minlength=n_endpoints) / counts
+        
+        for endpoint, i in endpoint_ids.items():
+            if error_rates[i] > 10:
+                bottlenecks.append(f"High error rate on {endpoint}: {error_rates[i]:.1f}%")
+            if avg_times[i] > 3000:
+                bottlenecks.append(f"Slow response on {endpoint}: {avg_times[i]:.2f}ms")
         
         return bottlenecks
 
 class FileCleanupVerifier:
     """Verify file cleanup works correctly under load"""
     
-    def __init__(self, base_url: str):
+    def __init__(self, base_url: str, session: aiohttp.ClientSession):
         self.base_url = base_url
+        self.session = session
         self.created_files = []
         
     async def verify_cleanup_under_load(self, concurrent_uploads: int = 20) -> Dict[str, Any]:
         """Test file cleanup with multiple concurrent uploads"""
         logger.info(f"Testing file cleanup with {concurrent_uploads} concurrent uploads")
         
-        async with aiohttp.ClientSession() as session:
-            # Create multiple file uploads
-            upload_tasks = []
-            for i in range(concurrent_uploads):
-                task = self.upload_test_file(session, i)
-                upload_tasks.append(task)
-            
-            # Wait for all uploads
-            upload_results = await asyncio.gather(*upload_tasks, return_exceptions=True)
-            
-            # Extract file IDs from successful uploads
-            file_ids = []
-            for result in upload_results:
-                if isinstance(result, dict) and result.get("success") and "file_id" in result:
-                    file_ids.append(result["file_id"])
-            
-            # Wait a bit for potential cleanup
-            await asyncio.sleep(5)
-            
-            # Test cleanup endpoint for each file
-            cleanup_results = []
-            for file_id in file_ids:
-                try:
-                    cleanup_result = await self.test_cleanup(session, file_id)
-                    cleanup_results.append(cleanup_result)
-                except Exception as e:
-                    cleanup_results.append({"success": False, "error": str(e)})
-            
-            successful_cleanups = sum(1 for r in cleanup_results if r.get("success", False))
-            
-            return {
-                "total_uploads": concurrent_uploads,
-                "successful_uploads": len(file_ids),
-                "cleanup_tests": len(cleanup_results),
-                "successful_cleanups": successful_cleanups,
-                "cleanup_success_rate": successful_cleanups / len(cleanup_results) * 100 if cleanup_results else 0
-            }
+        session = self.session
+        # Create multiple file uploads
+        upload_tasks = []
+        for i in range(concurrent_uploads):
+            task = self.upload_test_file(session, i)
+            upload_tasks.append(task)
+        
+        # Collect file IDs from successful uploads as they finish; upload_test_file
+        # reports failures in its result rather than raising
+        file_ids = []
+        for upload in asyncio.as_completed(upload_tasks):
+            result = await upload
+            if result.get("success") and "file_id" in result:
+                file_ids.append(result["file_id"])
+        
+        # Wait a bit for potential cleanup
+        await asyncio.sleep(5)
+        
+        # Test cleanup endpoint for each file
+        cleanup_results = []
+        for file_id in file_ids:
+            try:
+                cleanup_result = await self.test_cleanup(session, file_id)
+                cleanup_results.append(cleanup_result)
+            except Exception as e:
+                cleanup_results.append({"success": False, "error": str(e)})
+        
+        successful_cleanups = sum(1 for r in cleanup_results if r.get("success", False))
+        
+        return {
+            "total_uploads": concurrent_uploads,
+            "successful_uploads": len(file_ids),
+            "cleanup_tests": len(cleanup_results),
+            "successful_cleanups": successful_cleanups,
+            "cleanup_success_rate": successful_cleanups / len(cleanup_results) * 100 if cleanup_results else 0
+        }
     
     async def upload_test_file(self, session: aiohttp.ClientSession, file_id: int) -> Dict[str, Any]:
         """Upload a test file"""
-        pdf_content = b"""%PDF-1.4
-1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj
-2 0 obj<</Type/Pages/Kids[3 0 R]/Count 1>>endobj
-3 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 612 792]>>endobj
-xref 0 4
-0000000000 65535 f
-0000000010 00000 n
-0000000053 00000 n
-0000000109 00000 n
-trailer<</Size 4/Root 1 0 R>>
-startxref 178
-%%EOF"""
-        
         try:
             data = aiohttp.FormData()
-            data.add_field('file', pdf_content, 
+            data.add_field('file', _CLEANUP_PDF, 
                           filename=f'cleanup_test_{file_id}.pdf',
                           content_type='application/pdf')
             data.add_field('export_format', 'csv')
             
             async with session.post(f"{self.base_url}/extract", data=data) as response:
-                result = await response.json()
+                result = await response.json(loads=_json_loads)
                 if response.status == 200:
                     return {"success": True, "file_id": result.get("file_id")}
                 else:
@@ -495,7 +730,7 @@ startxref 178
         """Test cleanup for a specific file"""
         try:
             async with session.delete(f"{self.base_url}/cleanup/{file_id}") as response:
-                result = await response.json()
+                result = await response.json(loads=_json_loads)
                 return {"success": response.status == 200, "result": result}
         except Exception as e:
             return {"success": False, "error": str(e)}
@@ -503,10 +738,40 @@ startxref 178
 class PerformanceTestSuite:
     """Main performance testing suite with incremental approach"""
     
-    def __init__(self):
+    def __init__(self, server_pid: Optional[int] = None, raw_results_dir: Optional[str] = None):
         self.base_url = "http://localhost:8000"
         self.test_levels = [10, 25, 50, 100]  # User counts for incremental testing
         self.results = {}
+        self.session = None
+        # Server process to sample per-process CPU/RSS for (SERVER_PID when run as a script)
+        self.server_pid = server_pid
+        # Directory for per-level CSVs of raw request rows (RAW_RESULTS_DIR when run as a script)
+        self.raw_results_dir = raw_results_dir
+    
+    async def __aenter__(self):
+        """Open the one HTTP session shared by every test level and the cleanup test"""
+        connector = aiohttp.TCPConnector(
+            limit=0,  # Concurrency is bounded by limit_per_host; there is only one host
+            # Headroom well above the largest level so no user queues for a connection
+            limit_per_host=max(256, max(self.test_levels) * 4),
+            keepalive_timeout=60,
+            force_close=False,
+            enable_cleanup_closed=True,
+            use_dns_cache=True,
+            ttl_dns_cache=600
+        )
+        self.session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=60, connect=10),
+            connector=connector,
+            headers={"User-Agent": "PDFTablePro-LoadTester/1.0"}
+        )
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        """Close the shared HTTP session"""
+        if self.session:
+            await self.session.close()
+            self.session = None
         
     async def run_incremental_tests(self) -> Dict[str, PerformanceMetrics]:
         """Run incremental load tests with detailed analysis"""
@@ -523,10 +788,15 @@ class PerformanceTestSuite:
                 concurrent_users=user_count,
                 requests_per_user=10,
                 ramp_up_time=min(user_count // 2, 30),  # Scale ramp-up time
-                pdf_test_enabled=True
+                pdf_test_enabled=True,
+                server_pid=self.server_pid,
+                raw_results_path=(
+                    os.path.join(self.raw_results_dir, f"requests_{user_count}_users.csv")
+                    if self.raw_results_dir else None
+                )
             )
             
-            tester = LoadTester(config)
+            tester = LoadTester(config, self.session)
             
             try:
                 metrics = await tester.run_load_test()
@@ -584,6 +854,8 @@ class PerformanceTestSuite:
         print(f"   CPU Usage: {metrics.avg_cpu_usage:.1f}% avg, {metrics.max_cpu_usage:.1f}% max")
         print(f"   Memory Usage: {metrics.avg_memory_usage:.1f}% avg, {metrics.max_memory_usage:.1f}% max")
         print(f"   Memory Growth: {metrics.memory_growth:.1f}%")
+        if self.server_pid is not None:
+            print(f"   Server Process: {metrics.server_avg_cpu:.1f}% CPU avg, {metrics.server_rss_mb:.1f}MB peak RSS")
         
         if metrics.bottlenecks_identified:
             print("   ⚠️  Bottlenecks Identified:")
@@ -601,7 +873,7 @@ class PerformanceTestSuite:
         """Test file cleanup under load"""
         print("\n🧹 Testing File Cleanup Under Load...")
         
-        cleaner = FileCleanupVerifier(self.base_url)
+        cleaner = FileCleanupVerifier(self.base_url, self.session)
         cleanup_results = await cleaner.verify_cleanup_under_load(concurrent_uploads=20)
         
         print(f"   Total Uploads: {cleanup_results['total_uploads']}")
@@ -712,14 +984,12 @@ class PerformanceTestSuite:
         """Save comprehensive results to JSON file"""
         output_file = f"performance_test_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
         
-        # Convert metrics to dict for JSON serialization
-        json_results = {}
-        for key, metrics in all_results.items():
-            json_results[key] = asdict(metrics)
-        
         full_results = {
             "test_timestamp": datetime.now().isoformat(),
-            "load_test_results": json_results,
+            # orjson encodes the PerformanceMetrics dataclasses directly
+            "load_test_results": dict(all_results) if HAS_ORJSON else {
+                key: asdict(metrics) for key, metrics in all_results.items()
+            },
             "cleanup_test_results": cleanup_results,
             "optimization_recommendations": recommendations,
             "test_configuration": {
@@ -733,24 +1003,43 @@ class PerformanceTestSuite:
             }
         }
         
-        with open(output_file, 'w') as f:
-            json.dump(full_results, f, indent=2, default=str)
+        if HAS_ORJSON:
+            with open(output_file, 'wb') as f:
+                f.write(orjson.dumps(
+                    full_results,
+                    option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_DATACLASS | orjson.OPT_NON_STR_KEYS,
+                    default=str
+                ))
+        else:
+            # Encode first so the document goes out in one write, not one per token
+            encoded = json.dumps(full_results, indent=2, default=str)
+            with open(output_file, 'w') as f:
+                f.write(encoded)
         
         print(f"\n💾 Detailed results saved to: {output_file}")
         return output_file
 
+def run_event_loop(coro):
+    """Run the driver coroutine on uvloop when installed, else the default loop"""
+    loop_factory = uvloop.new_event_loop if HAS_UVLOOP else None
+    with asyncio.Runner(loop_factory=loop_factory) as runner:
+        return runner.run(coro)
+
 async def main():
     """Run comprehensive performance testing suite"""
-    suite = PerformanceTestSuite()
-    
-    # Run incremental load tests
-    load_test_results = await suite.run_incremental_tests()
-    
-    # Test file cleanup
-    cleanup_results = await suite.test_file_cleanup()
+    server_pid = os.environ.get("SERVER_PID")
+    async with PerformanceTestSuite(
+        server_pid=int(server_pid) if server_pid else None,
+        raw_results_dir=os.environ.get("RAW_RESULTS_DIR")
+    ) as suite:
+        # Run incremental load tests
+        load_test_results = await suite.run_incremental_tests()
+        
+        # Test file cleanup
+        cleanup_results = await suite.test_file_cleanup()
     
     # Generate recommendations
-    recommendations = suite.generate_optimization_recommendations(load_test_results)
+    recommendations = await asyncio.to_thread(suite.generate_optimization_recommendations, load_test_results)
     
     # Print final summary
     print("\n" + "="*60)
@@ -792,7 +1081,7 @@ if __name__ == "__main__":
     
     # Run the test suite
     try:
-        asyncio.run(main())
+        run_event_loop(main())
     except KeyboardInterrupt:
         print("\n⚠️  Testing interrupted by user")
     except Exception as e:
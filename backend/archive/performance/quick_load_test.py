@@ -6,16 +6,30 @@ Simplified version for rapid performance validation during development.
 import asyncio
 import aiohttp
 import time
-import statistics
 import sys
+import numpy as np
 from typing import List, Dict, Any
 
 class QuickLoadTest:
     """Simple load test for development validation"""
     
-    def __init__(self, base_url: str = "http://localhost:8000"):
+    def __init__(self, base_url: str = "http://localhost:8000", scenario_delay: float = 2.0):
         self.base_url = base_url
+        self.scenario_delay = scenario_delay  # seconds to pause between scenarios
         self.results = []
+        self._session = None
+    
+    async def __aenter__(self) -> "QuickLoadTest":
+        # One session for every scenario: connections and DNS answers are reused.
+        # limit=0 leaves the pool unbounded so the client never queues requests
+        # itself and the test measures server capacity
+        connector = aiohttp.TCPConnector(limit=0, ttl_dns_cache=300, use_dns_cache=True)
+        self._session = aiohttp.ClientSession(connector=connector)
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._session.close()
+        self._session = None
     
     async def make_request(self, session: aiohttp.ClientSession, endpoint: str, user_id: int) -> Dict[str, Any]:
         """Make a single request and measure response time"""
@@ -23,7 +37,8 @@ class QuickLoadTest:
         
         try:
             async with session.get(f"{self.base_url}{endpoint}") as response:
-                content = await response.text()
+                # Drain the body without decoding it; only the status is inspected
+                await response.read()
                 end_time = time.time()
                 
                 return {
@@ -49,45 +64,57 @@ class QuickLoadTest:
         """Run a quick load test"""
         print(f"🚀 Quick Load Test: {users} concurrent requests to {endpoint}")
         
-        async with aiohttp.ClientSession() as session:
-            start_time = time.time()
-            
-            # Create tasks for concurrent requests
-            tasks = []
-            for user_id in range(users):
-                task = self.make_request(session, endpoint, user_id)
-                tasks.append(task)
-            
-            # Execute all requests concurrently
-            results = await asyncio.gather(*tasks)
-            end_time = time.time()
-            
-            # Calculate metrics
-            response_times = [r["response_time"] for r in results]
-            successful = [r for r in results if r["success"]]
-            rate_limited = [r for r in results if r["rate_limited"]]
-            errors = [r for r in results if "error" in r]
-            
-            total_time = (end_time - start_time) * 1000  # ms
-            
-            metrics = {
-                "total_requests": len(results),
-                "successful_requests": len(successful),
-                "rate_limited_requests": len(rate_limited),
-                "failed_requests": len(results) - len(successful),
-                "total_time": total_time,
-                "avg_response_time": statistics.mean(response_times) if response_times else 0,
-                "min_response_time": min(response_times) if response_times else 0,
-                "max_response_time": max(response_times) if response_times else 0,
-                "requests_per_second": len(results) / (total_time / 1000) if total_time > 0 else 0,
-                "success_rate": len(successful) / len(results) * 100 if results else 0,
-                "rate_limit_rate": len(rate_limited) / len(results) * 100 if results else 0
-            }
-            
-            if errors:
-                metrics["errors"] = [r.get("error", "Unknown") for r in errors[:5]]  # First 5 errors
-            
-            return metrics
+        if self._session is None:
+            raise RuntimeError("QuickLoadTest must be entered with 'async with' before running tests")
+        session = self._session
+        
+        start_time = time.time()
+        
+        # Create tasks for concurrent requests
+        tasks = []
+        for user_id in range(users):
+            task = self.make_request(session, endpoint, user_id)
+            tasks.append(task)
+        
+        # Execute all requests concurrently
+        results = await asyncio.gather(*tasks)
+        end_time = time.time()
+        
+        # Calculate metrics
+        response_times = np.fromiter((r["response_time"] for r in results),
+                                     dtype=np.float64, count=len(results))
+        successful = [r for r in results if r["success"]]
+        rate_limited = [r for r in results if r["rate_limited"]]
+        errors = [r for r in results if "error" in r]
+        
+        total_time = (end_time - start_time) * 1000  # ms
+        
+        if response_times.size:
+            p50, p95, p99 = (float(p) for p in np.percentile(response_times, [50, 95, 99]))
+        else:
+            p50 = p95 = p99 = 0
+        
+        metrics = {
+            "total_requests": len(results),
+            "successful_requests": len(successful),
+            "rate_limited_requests": len(rate_limited),
+            "failed_requests": len(results) - len(successful),
+            "total_time": total_time,
+            "avg_response_time": float(response_times.mean()) if response_times.size else 0,
+            "min_response_time": float(response_times.min()) if response_times.size else 0,
+            "max_response_time": float(response_times.max()) if response_times.size else 0,
+            "p50_response_time": p50,
+            "p95_response_time": p95,
+            "p99_response_time": p99,
+            "requests_per_second": len(results) / (total_time / 1000) if total_time > 0 else 0,
+            "success_rate": len(successful) / len(results) * 100 if results else 0,
+            "rate_limit_rate": len(rate_limited) / len(results) * 100 if results else 0
+        }
+        
+        if errors:
+            metrics["errors"] = [r.get("error", "Unknown") for r in errors[:5]]  # First 5 errors
+        
+        return metrics
     
     def print_results(self, metrics: Dict[str, Any]):
         """Print formatted test results"""
@@ -100,6 +127,8 @@ class QuickLoadTest:
         print(f"   Avg Response: {metrics['avg_response_time']:.2f}ms")
         print(f"   Min Response: {metrics['min_response_time']:.2f}ms") 
         print(f"   Max Response: {metrics['max_response_time']:.2f}ms")
+        print(f"   Percentiles: p50 {metrics['p50_response_time']:.2f}ms | "
+              f"p95 {metrics['p95_response_time']:.2f}ms | p99 {metrics['p99_response_time']:.2f}ms")
         print(f"   Throughput: {metrics['requests_per_second']:.2f} req/s")
         
         # Performance assessment
@@ -122,8 +151,6 @@ class QuickLoadTest:
 
 async def main():
     """Run quick performance tests"""
-    tester = QuickLoadTest()
-    
     # Test different scenarios
     scenarios = [
         {"users": 10, "endpoint": "/health", "name": "Health Check (10 users)"},
@@ -134,24 +161,26 @@ async def main():
     
     all_results = {}
     
-    for scenario in scenarios:
-        print(f"\n{'-' * 50}")
-        print(f"Testing: {scenario['name']}")
-        
-        try:
-            metrics = await tester.run_quick_test(
-                users=scenario['users'],
-                endpoint=scenario['endpoint']
-            )
+    async with QuickLoadTest() as tester:
+        for scenario in scenarios:
+            print(f"\n{'-' * 50}")
+            print(f"Testing: {scenario['name']}")
             
-            tester.print_results(metrics)
-            all_results[scenario['name']] = metrics
+            try:
+                metrics = await tester.run_quick_test(
+                    users=scenario['users'],
+                    endpoint=scenario['endpoint']
+                )
             
-            # Small delay between tests
-            await asyncio.sleep(2)
+                tester.print_results(metrics)
+                all_results[scenario['name']] = metrics
             
-        except Exception as e:
-            print(f"❌ Test failed: {e}")
+                # Let the server settle between tests
+                if tester.scenario_delay:
+                    await asyncio.sleep(tester.scenario_delay)
+            
+            except Exception as e:
+                print(f"❌ Test failed: {e}")
     
     # Summary
     print(f"\n{'=' * 50}")
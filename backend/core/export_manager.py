@@ -4,16 +4,57 @@ Handles secure export of extracted table data
 """
 
 import pandas as pd
-import json
+import numpy as np
+import orjson
+import asyncio
 import tempfile
 import os
+import re
+import uuid
+import zipfile
 from pathlib import Path
 from typing import List, Dict, Any, Optional
-from io import BytesIO
+from io import BytesIO, TextIOWrapper
 import logging
 
+# PyArrow's vectorized CSV writer handles all-integer tables; pandas to_csv the rest.
+# Parquet export is only offered when PyArrow is installed
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pa_parquet
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+# xlsxwriter streams rows to disk; openpyxl (through pandas) is the fallback
+try:
+    import xlsxwriter
+    HAS_XLSXWRITER = True
+except ImportError:
+    HAS_XLSXWRITER = False
+
 logger = logging.getLogger(__name__)
 
+# Filename sanitization patterns
+_UNSAFE_FILENAME_CHARS = re.compile(r'[^\w\s\-]')
+_WHITESPACE_RUN = re.compile(r'\s+')
+
+
+def _unique_column_names(columns) -> List[str]:
+    """String column names with repeats suffixed (_1, _2, ...); None becomes ''"""
+    names = []
+    seen = set()
+    for column in columns:
+        base = '' if column is None else str(column)
+        name, n = base, 0
+        while name in seen:
+            n += 1
+            name = f"{base}_{n}"
+        seen.add(name)
+        names.append(name)
+    return names
+
 
 class ExportResult:
     """Container for export results"""
@@ -34,6 +75,10 @@ class TableExportManager:
         self.temp_dir = Path(tempfile.gettempdir()) / "pdftable_exports"
         self.temp_dir.mkdir(exist_ok=True)
         self.supported_formats = ['csv', 'xlsx', 'json']
+        if HAS_PYARROW:
+            self.supported_formats.append('parquet')
+        # Excel number formats by numpy dtype kind (signed/unsigned int, float, datetime)
+        self.xlsx_num_formats = {'i': '#,##0', 'u': '#,##0', 'f': '#,##0.00', 'M': 'yyyy-mm-dd'}
     
     async def export_tables(
         self, 
@@ -56,7 +101,6 @@ class TableExportManager:
                 return result
             
             # Generate secure filename
-            import uuid
             file_id = str(uuid.uuid4())
             base_name = self._sanitize_filename(original_filename)
             
@@ -66,6 +110,8 @@ class TableExportManager:
                 result = await self._export_excel(tables, file_id, base_name)
             elif export_format.lower() == 'json':
                 result = await self._export_json(tables, file_id, base_name)
+            elif export_format.lower() == 'parquet':
+                result = await self._export_parquet(tables, file_id, base_name)
             
             return result
             
@@ -85,28 +131,22 @@ class TableExportManager:
                 filename = f"{file_id}_{base_name}.csv"
                 file_path = self.temp_dir / filename
                 
-                tables[0].to_csv(file_path, index=False, encoding='utf-8')
+                # Writers are blocking C code; keep them off the event loop
+                result.file_size = await asyncio.to_thread(self._write_csv_file, tables[0], file_path)
                 
                 result.file_path = str(file_path)
                 result.download_filename = f"{base_name}_table.csv"
                 
             else:
                 # Multiple tables - create ZIP file
-                import zipfile
-                
                 zip_filename = f"{file_id}_{base_name}_tables.zip"
                 zip_path = self.temp_dir / zip_filename
                 
-                with zipfile.ZipFile(zip_path, 'w') as zipf:
-                    for i, table in enumerate(tables):
-                        csv_filename = f"table_{i+1}.csv"
-                        csv_data = table.to_csv(index=False, encoding='utf-8')
-                        zipf.writestr(csv_filename, csv_data)
+                result.file_size = await asyncio.to_thread(self._write_csv_zip, tables, zip_path)
                 
                 result.file_path = str(zip_path)
                 result.download_filename = f"{base_name}_tables.zip"
             
-            result.file_size = os.path.getsize(result.file_path)
             result.success = True
             
         except Exception as e:
@@ -114,6 +154,48 @@ class TableExportManager:
         
         return result
     
+    def _write_csv_file(self, table: pd.DataFrame, file_path: Path) -> int:
+        """Write one table to a CSV file, returning the file size"""
+        with open(file_path, 'wb') as csv_file:
+            self._write_csv(table, csv_file)
+            return csv_file.tell()
+    
+    def _write_csv_zip(self, tables: List[pd.DataFrame], zip_path: Path) -> int:
+        """Write each table as a CSV member of a ZIP archive, returning the file size"""
+        with open(zip_path, 'wb') as zip_file:
+            with zipfile.ZipFile(zip_file, 'w') as zipf:
+                for i, table in enumerate(tables):
+                    csv_filename = f"table_{i+1}.csv"
+                    # Write rows straight into the member stream instead of
+                    # building the whole CSV string first
+                    with zipf.open(csv_filename, 'w', force_zip64=True) as member:
+                        self._write_csv(table, member)
+            # Closing the archive writes the central directory; the offset
+            # is now the full file size
+            return zip_file.tell()
+    
+    def _write_csv(self, table: pd.DataFrame, stream):
+        """Write a table as UTF-8 CSV to a binary stream"""
+        # Arrow writes NumPy integers exactly as pandas does, but not booleans
+        # (true/false), whole floats (2.0 as 2), strings (always quoted) or nulls, so
+        # only all-integer tables have their rows written by Arrow; it also needs
+        # unique column names
+        arrow_rows = (HAS_PYARROW and len(table.columns) > 0 and table.columns.is_unique
+                      and all(isinstance(dtype, np.dtype) and dtype.kind in 'iu'
+                              for dtype in table.dtypes))
+        
+        text_stream = TextIOWrapper(stream, encoding='utf-8', newline='')
+        try:
+            # The header always comes from pandas, which quotes only where needed
+            (table.iloc[:0] if arrow_rows else table).to_csv(text_stream, index=False)
+            text_stream.flush()
+        finally:
+            text_stream.detach()  # leave the caller's stream open
+        
+        if arrow_rows:
+            pa_csv.write_csv(pa.Table.from_pandas(table, preserve_index=False), stream,
+                             pa_csv.WriteOptions(include_header=False))
+    
     async def _export_excel(self, tables: List[pd.DataFrame], file_id: str, base_name: str) -> ExportResult:
         """Export tables as Excel file (multiple sheets if multiple tables)"""
         result = ExportResult()
@@ -123,17 +205,15 @@ class TableExportManager:
             filename = f"{file_id}_{base_name}.xlsx"
             file_path = self.temp_dir / filename
             
-            with pd.ExcelWriter(file_path, engine='openpyxl') as writer:
-                if len(tables) == 1:
-                    tables[0].to_excel(writer, sheet_name='Table', index=False)
-                else:
-                    for i, table in enumerate(tables):
-                        sheet_name = f'Table_{i+1}'
-                        table.to_excel(writer, sheet_name=sheet_name, index=False)
+            if len(tables) == 1:
+                sheets = [('Table', tables[0])]
+            else:
+                sheets = [(f'Table_{i+1}', table) for i, table in enumerate(tables)]
+            
+            result.file_size = await asyncio.to_thread(self._write_excel_file, file_path, sheets)
             
             result.file_path = str(file_path)
             result.download_filename = f"{base_name}_tables.xlsx"
-            result.file_size = os.path.getsize(result.file_path)
             result.success = True
             
         except Exception as e:
@@ -141,6 +221,57 @@ class TableExportManager:
         
         return result
     
+    def _write_excel_file(self, file_path: Path, sheets: List[tuple]) -> int:
+        """Write (sheet_name, DataFrame) pairs to an Excel file, returning the file size"""
+        with open(file_path, 'wb') as xlsx_file:
+            if HAS_XLSXWRITER:
+                self._write_xlsx(xlsx_file, sheets)
+            else:
+                with pd.ExcelWriter(xlsx_file, engine='openpyxl') as writer:
+                    for sheet_name, table in sheets:
+                        table.to_excel(writer, sheet_name=sheet_name, index=False)
+            return xlsx_file.tell()
+    
+    def _write_xlsx(self, xlsx_file, sheets: List[tuple]):
+        """
+        Write (sheet_name, DataFrame) pairs to an open binary file with xlsxwriter
+        in constant_memory mode
+        
+        Rows are written strictly in order, which constant_memory requires (each row
+        is flushed to disk once the next one starts). pandas' to_excel emits cells
+        column by column, so the rows are written here directly instead.
+        """
+        options = {
+            'constant_memory': True,
+            # Extracted cells are data, never formulas or links; skips a per-string regex
+            'strings_to_formulas': False,
+            'strings_to_urls': False,
+        }
+        workbook = xlsxwriter.Workbook(xlsx_file, options)
+        try:
+            # Number formats keyed by dtype kind, created once per workbook and
+            # applied per column rather than per cell
+            column_formats = {
+                kind: workbook.add_format({'num_format': num_format})
+                for kind, num_format in self.xlsx_num_formats.items()
+            }
+            
+            for sheet_name, table in sheets:
+                worksheet = workbook.add_worksheet(sheet_name)
+                for col_idx, dtype in enumerate(table.dtypes):
+                    column_format = column_formats.get(dtype.kind)
+                    if column_format is not None:
+                        worksheet.set_column(col_idx, col_idx, None, column_format)
+                
+                worksheet.write_row(0, 0, [str(column) for column in table.columns])
+                
+                # Missing values become blank cells, as with to_excel
+                body = table.astype(object).where(table.notna(), None)
+                for row_num, row in enumerate(body.itertuples(index=False, name=None), start=1):
+                    worksheet.write_row(row_num, 0, row)
+        finally:
+            workbook.close()
+    
     async def _export_json(self, tables: List[pd.DataFrame], file_id: str, base_name: str) -> ExportResult:
         """Export tables as JSON"""
         result = ExportResult()
@@ -150,40 +281,10 @@ class TableExportManager:
             filename = f"{file_id}_{base_name}.json"
             file_path = self.temp_dir / filename
             
-            # Convert tables to JSON format
-            if len(tables) == 1:
-                json_data = {
-                    "table": tables[0].to_dict(orient='records'),
-                    "metadata": {
-                        "rows": len(tables[0]),
-                        "columns": len(tables[0].columns),
-                        "column_names": list(tables[0].columns)
-                    }
-                }
-            else:
-                json_data = {
-                    "tables": [],
-                    "metadata": {
-                        "total_tables": len(tables),
-                        "table_info": []
-                    }
-                }
-                
-                for i, table in enumerate(tables):
-                    json_data["tables"].append(table.to_dict(orient='records'))
-                    json_data["metadata"]["table_info"].append({
-                        "table_index": i + 1,
-                        "rows": len(table),
-                        "columns": len(table.columns),
-                        "column_names": list(table.columns)
-                    })
-            
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(json_data, f, indent=2, ensure_ascii=False)
+            result.file_size = await asyncio.to_thread(self._write_json_file, tables, file_path)
             
             result.file_path = str(file_path)
             result.download_filename = f"{base_name}_tables.json"
-            result.file_size = os.path.getsize(result.file_path)
             result.success = True
             
         except Exception as e:
@@ -191,16 +292,127 @@ class TableExportManager:
         
         return result
     
+    def _write_json_file(self, tables: List[pd.DataFrame], file_path: Path) -> int:
+        """Write tables as one JSON document, returning the file size"""
+        # Row bodies come straight from pandas' C serializer as JSON text and are
+        # spliced into the document; only the small metadata goes through orjson
+        with open(file_path, 'wb') as f:
+            if len(tables) == 1:
+                f.write(b'{"table":')
+                f.write(self._records_json(tables[0]))
+                f.write(b',"metadata":')
+                f.write(self._dumps_json(self._table_metadata(tables[0])))
+                f.write(b'}')
+            else:
+                f.write(b'{"tables":[')
+                for i, table in enumerate(tables):
+                    if i:
+                        f.write(b',')
+                    f.write(self._records_json(table))
+                f.write(b'],"metadata":')
+                f.write(self._dumps_json({
+                    "total_tables": len(tables),
+                    "table_info": [
+                        {"table_index": i + 1, **self._table_metadata(table)}
+                        for i, table in enumerate(tables)
+                    ]
+                }))
+                f.write(b'}')
+            return f.tell()
+    
+    async def _export_parquet(self, tables: List[pd.DataFrame], file_id: str, base_name: str) -> ExportResult:
+        """Export tables as Parquet (ZIP of one file per table if multiple tables)"""
+        result = ExportResult()
+        result.export_format = 'parquet'
+        
+        try:
+            if len(tables) == 1:
+                filename = f"{file_id}_{base_name}.parquet"
+                file_path = self.temp_dir / filename
+                
+                result.file_size = await asyncio.to_thread(self._write_parquet_file, tables[0], file_path)
+                
+                result.file_path = str(file_path)
+                result.download_filename = f"{base_name}_table.parquet"
+                
+            else:
+                # Multiple tables - one Parquet file per table, as with CSV; the
+                # members are already compressed, so they are stored as-is
+                zip_filename = f"{file_id}_{base_name}_tables.zip"
+                zip_path = self.temp_dir / zip_filename
+                
+                result.file_size = await asyncio.to_thread(self._write_parquet_zip, tables, zip_path)
+                
+                result.file_path = str(zip_path)
+                result.download_filename = f"{base_name}_tables.zip"
+            
+            result.success = True
+            
+        except Exception as e:
+            result.error_message = f"Parquet export failed: {str(e)}"
+        
+        return result
+    
+    def _write_parquet_file(self, table: pd.DataFrame, file_path: Path) -> int:
+        """Write one table to a Parquet file, returning the file size"""
+        with open(file_path, 'wb') as parquet_file:
+            self._write_parquet(table, parquet_file)
+            return parquet_file.tell()
+    
+    def _write_parquet_zip(self, tables: List[pd.DataFrame], zip_path: Path) -> int:
+        """Write each table as a Parquet member of a ZIP archive, returning the file size"""
+        with open(zip_path, 'wb') as zip_file:
+            with zipfile.ZipFile(zip_file, 'w', compression=zipfile.ZIP_STORED) as zipf:
+                for i, table in enumerate(tables):
+                    with zipf.open(f"table_{i+1}.parquet", 'w', force_zip64=True) as member:
+                        self._write_parquet(table, member)
+            return zip_file.tell()
+    
+    def _write_parquet(self, table: pd.DataFrame, stream):
+        """Write a table as ZSTD-compressed, dictionary-encoded Parquet to a binary stream"""
+        # Parquet field names must be unique strings; repeated or blank headers are common
+        if not table.columns.is_unique or not all(isinstance(c, str) for c in table.columns):
+            table = table.set_axis(_unique_column_names(table.columns), axis=1)
+        try:
+            arrow_table = pa.Table.from_pandas(table, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            # Mixed-type object columns have no Arrow type; store them as strings
+            object_columns = table.select_dtypes(include='object').columns
+            arrow_table = pa.Table.from_pandas(
+                table.astype({column: 'string' for column in object_columns}),
+                preserve_index=False
+            )
+        pa_parquet.write_table(arrow_table, stream, compression='zstd', use_dictionary=True)
+    
+    def _records_json(self, table: pd.DataFrame) -> bytes:
+        """Serialize a table as a JSON array of row objects"""
+        if not table.columns.is_unique:
+            # to_json refuses repeated headers; to_dict keeps the last value per
+            # name, as this export always did for such tables
+            return self._dumps_json(table.to_dict(orient='records'))
+        return table.to_json(orient='records', force_ascii=False, date_format='iso').encode('utf-8')
+    
+    def _table_metadata(self, table: pd.DataFrame) -> Dict[str, Any]:
+        """Shape and column names of an exported table"""
+        rows, columns = table.shape
+        return {
+            "rows": rows,
+            "columns": columns,
+            "column_names": table.columns.tolist()
+        }
+    
+    def _dumps_json(self, data: Any) -> bytes:
+        """Serialize export metadata; numpy scalars are native, anything else falls back to str()"""
+        return orjson.dumps(data, default=str, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    
     def _sanitize_filename(self, filename: str) -> str:
         """Sanitize filename for safe export"""
-        import re
-        
         # Remove extension if present
         name = os.path.splitext(filename)[0]
         
         # Replace dangerous characters
-        name = re.sub(r'[^\w\s\-]', '', name)
-        name = re.sub(r'\s+', '_', name)
+        name = _UNSAFE_FILENAME_CHARS.sub('', name)
+        name = _WHITESPACE_RUN.sub('_', name)
         
         # Limit length
         return name[:50] if name else "extracted"
@@ -3,6 +3,8 @@ OCR Service for processing scanned PDFs using Tesseract
 Restricted to paid tier users only
 """
 import os
+import ctypes
+import subprocess
 import tempfile
 import pytesseract
 from PIL import Image
@@ -10,15 +12,84 @@ from pdf2image import convert_from_path
 from typing import List, Dict, Any, Optional
 import logging
 import asyncio
+import threading
 from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
 import io
 
+# tesserocr keeps Tesseract and its models loaded in-process; pytesseract
+# (one tesseract subprocess per call) is the fallback
+try:
+    from tesserocr import PyTessBaseAPI, PSM, RIL, iterate_level
+    HAS_TESSEROCR = True
+except ImportError:
+    HAS_TESSEROCR = False
+
+# PyMuPDF renders and reads text in-process; pdf2image (Poppler) and pypdf are the fallback
+try:
+    import fitz
+    HAS_PYMUPDF = True
+except ImportError:
+    HAS_PYMUPDF = False
+
+# Numba compiles the row-break scan to machine code; the NumPy binary search is the fallback
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
 logger = logging.getLogger(__name__)
 
+if HAS_NUMBA:
+    @njit(cache=True)
+    def _row_breaks(ys_sorted, tol):
+        """Start index of every row after the first: a row holds each element
+        within tol below the row's first element"""
+        out = np.empty(ys_sorted.shape[0], np.int64)
+        j = 0
+        anchor = ys_sorted[0]
+        for i in range(1, ys_sorted.shape[0]):
+            if ys_sorted[i] - anchor > tol:
+                out[j] = i
+                j += 1
+                anchor = ys_sorted[i]
+        return out[:j]
+
+def _limit_openmp_threads(threads: int):
+    """
+    Cap OpenMP parallel regions started from the calling thread
+    
+    libgomp keeps this setting per thread, so only the OCR thread is affected. The
+    OMP_THREAD_LIMIT variable would not help here: libgomp reads it when it loads,
+    before any handle is created.
+    """
+    try:
+        ctypes.CDLL('libgomp.so.1').omp_set_num_threads(threads)
+    except (OSError, AttributeError):
+        pass  # No libgomp (Tesseract built without OpenMP, or not Linux)
+
 class OCRService:
     def __init__(self):
-        self.executor = ThreadPoolExecutor(max_workers=2)
+        # Threads suffice: the heavy lifting runs in the Tesseract/Poppler child
+        # processes, so one thread per core keeps every core busy
+        self.executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 2)
+        # Pages per Tesseract invocation: batches amortize process start-up and
+        # model loading, while several batches still run in parallel
+        self.pages_per_batch = 5
+        # OpenMP threads per Tesseract run. Batches already run in parallel, so one
+        # thread each keeps them from oversubscribing the cores. Applied to the
+        # tesseract subprocess environment and to each OCR thread's tesserocr
+        # handle, not to the API process as a whole
+        self.tesseract_threads = 1
+        # Pages are OCR'd as grayscale at ocr_dpi; pages whose mean word confidence
+        # falls below retry_confidence are re-rendered and re-read at retry_dpi
+        self.ocr_dpi = 200
+        self.retry_dpi = 300
+        self.retry_confidence = 60
+        # One persistent tesserocr handle per executor thread (handles are not thread-safe)
+        self._tess_local = threading.local()
         # Configure Tesseract path for Windows if needed
         if os.name == 'nt':  # Windows
             try:
@@ -44,13 +115,17 @@ class OCRService:
         
         try:
             # Convert PDF to images
-            images = await self._pdf_to_images(pdf_path)
+            images = await self._pdf_to_images(pdf_path, dpi=self.ocr_dpi)
+            
+            # Extract text using OCR, one Tesseract call per batch of pages, batches concurrently
+            batch_results = await asyncio.gather(*[
+                self._extract_text_from_images(images[start:start + self.pages_per_batch], first_page=start + 1)
+                for start in range(0, len(images), self.pages_per_batch)
+            ])
+            all_text_data = [block for text_data in batch_results for block in text_data]
             
-            # Extract text from images using OCR
-            all_text_data = []
-            for i, image in enumerate(images):
-                text_data = await self._extract_text_from_image(image, page_num=i+1)
-                all_text_data.extend(text_data)
+            # Re-read pages that did not OCR cleanly at the lower resolution
+            all_text_data = await self._retry_low_confidence_pages(pdf_path, all_text_data, len(images))
             
             # Process extracted text to identify and structure tables
             tables = self._process_ocr_text_to_tables(all_text_data)
@@ -67,32 +142,91 @@ class OCRService:
             logger.error(f"OCR processing failed: {str(e)}")
             raise Exception(f"OCR processing failed: {str(e)}")
 
-    async def _pdf_to_images(self, pdf_path: str) -> List[Image.Image]:
-        """Convert PDF pages to images"""
+    async def _retry_low_confidence_pages(
+        self, pdf_path: str, text_data: List[Dict[str, Any]], page_count: int
+    ) -> List[Dict[str, Any]]:
+        """Re-OCR pages whose mean confidence is below retry_confidence at retry_dpi"""
+        confidences = {page: [] for page in range(1, page_count + 1)}
+        for block in text_data:
+            confidences[block['page']].append(block['confidence'])
+        
+        retry_pages = [
+            page for page, values in confidences.items()
+            if not values or sum(values) / len(values) < self.retry_confidence
+        ]
+        if not retry_pages:
+            return text_data
+        
+        logger.info(f"Re-running OCR at {self.retry_dpi} DPI for pages {retry_pages}")
+        
+        async def retry_page(page: int) -> List[Dict[str, Any]]:
+            images = await self._pdf_to_images(pdf_path, dpi=self.retry_dpi, first_page=page, last_page=page)
+            return await self._extract_text_from_images(images, first_page=page)
+        
+        retried = await asyncio.gather(*[retry_page(page) for page in retry_pages])
+        
+        retry_set = set(retry_pages)
+        kept = [block for block in text_data if block['page'] not in retry_set]
+        return kept + [block for blocks in retried for block in blocks]
+
+    async def _pdf_to_images(
+        self, pdf_path: str, dpi: int = 200, grayscale: bool = True,
+        first_page: int = 1, last_page: int = 10  # Limit to first 10 pages for performance
+    ) -> List[Image.Image]:
+        """Convert PDF pages to images (grayscale by default; OCR does not use color)"""
         loop = asyncio.get_event_loop()
         
         def convert_pdf():
+            if HAS_PYMUPDF:
+                with fitz.open(pdf_path) as doc:
+                    images = []
+                    colorspace = fitz.csGRAY if grayscale else fitz.csRGB
+                    mode = 'L' if grayscale else 'RGB'
+                    for page in doc.pages(first_page - 1, min(last_page, doc.page_count)):
+                        pix = page.get_pixmap(dpi=dpi, colorspace=colorspace)
+                        images.append(Image.frombytes(mode, (pix.width, pix.height), pix.samples))
+                    return images
+            
             return convert_from_path(
                 pdf_path,
-                dpi=300,  # Higher DPI for better OCR accuracy
-                first_page=1,
-                last_page=10  # Limit to first 10 pages for performance
+                dpi=dpi,
+                grayscale=grayscale,
+                first_page=first_page,
+                last_page=last_page,
+                thread_count=os.cpu_count() or 1  # Poppler renders pages in parallel
             )
         
         images = await loop.run_in_executor(self.executor, convert_pdf)
         return images
 
-    async def _extract_text_from_image(self, image: Image.Image, page_num: int) -> List[Dict[str, Any]]:
-        """Extract text from image using Tesseract OCR"""
+    async def _extract_text_from_images(self, images: List[Image.Image], first_page: int) -> List[Dict[str, Any]]:
+        """Extract text from consecutive page images with a single Tesseract OCR call"""
         loop = asyncio.get_event_loop()
         
         def extract_text():
-            # Get detailed OCR data with bounding boxes
-            ocr_data = pytesseract.image_to_data(
-                image, 
-                output_type=pytesseract.Output.DICT,
-                config='--psm 6'  # Assume a single uniform block of text
-            )
+            if HAS_TESSEROCR:
+                return self._recognize_with_tesserocr(images, first_page)
+            
+            # Tesseract reads every frame of a multi-page TIFF in one run and tags
+            # each result with its (1-based) page_num
+            with tempfile.NamedTemporaryFile(suffix='.tif', delete=False) as batch_file:
+                batch_path = batch_file.name
+            try:
+                images[0].save(batch_path, save_all=True, append_images=images[1:], compression='tiff_deflate')
+                
+                # Get detailed OCR data with bounding boxes. tesseract runs directly
+                # rather than through pytesseract, which always passes the process
+                # environment to its subprocess
+                tsv = subprocess.run(
+                    [pytesseract.pytesseract.tesseract_cmd, batch_path, 'stdout',
+                     '--psm', '6',  # Assume a single uniform block of text
+                     '-c', 'tessedit_create_tsv=1'],
+                    env={**os.environ, 'OMP_THREAD_LIMIT': str(self.tesseract_threads)},
+                    capture_output=True, check=True, text=True
+                ).stdout
+                ocr_data = pytesseract.pytesseract.file_to_dict(tsv, '\t', -1)
+            finally:
+                os.unlink(batch_path)
             
             # Filter out low confidence results
             min_confidence = 30
@@ -109,13 +243,55 @@ class OCRService:
                             'y': ocr_data['top'][i],
                             'width': ocr_data['width'][i],
                             'height': ocr_data['height'][i],
-                            'page': page_num
+                            'page': first_page + ocr_data['page_num'][i] - 1
                         })
             
             return text_blocks
         
         return await loop.run_in_executor(self.executor, extract_text)
 
+    def _get_tess_api(self) -> "PyTessBaseAPI":
+        """Return this thread's persistent Tesseract handle, creating it on first use"""
+        api = getattr(self._tess_local, 'api', None)
+        if api is None:
+            _limit_openmp_threads(self.tesseract_threads)
+            api = PyTessBaseAPI(psm=PSM.SINGLE_BLOCK)  # Assume a single uniform block of text
+            self._tess_local.api = api
+        return api
+
+    def _recognize_with_tesserocr(self, images: List[Image.Image], first_page: int) -> List[Dict[str, Any]]:
+        """OCR page images word by word with the thread's persistent Tesseract handle"""
+        api = self._get_tess_api()
+        
+        # Filter out low confidence results
+        min_confidence = 30
+        text_blocks = []
+        
+        for offset, image in enumerate(images):
+            api.SetImage(image)
+            api.Recognize()
+            iterator = api.GetIterator()
+            if iterator is None:
+                continue
+            
+            for word in iterate_level(iterator, RIL.WORD):
+                confidence = int(word.Confidence(RIL.WORD))
+                if confidence > min_confidence:
+                    text = (word.GetUTF8Text(RIL.WORD) or '').strip()
+                    if text:
+                        x1, y1, x2, y2 = word.BoundingBox(RIL.WORD)
+                        text_blocks.append({
+                            'text': text,
+                            'confidence': confidence,
+                            'x': x1,
+                            'y': y1,
+                            'width': x2 - x1,
+                            'height': y2 - y1,
+                            'page': first_page + offset
+                        })
+        
+        return text_blocks
+
     def _process_ocr_text_to_tables(self, text_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """
         Process OCR text data to identify and structure tables
@@ -182,27 +358,29 @@ class OCRService:
         if not sorted_data:
             return []
         
+        # Coordinates as arrays: each row boundary is one binary search and each
+        # row's left-to-right order one argsort, instead of per-token Python work
+        count = len(sorted_data)
+        ys = np.fromiter((item['y'] for item in sorted_data), dtype=np.int64, count=count)
+        xs = np.fromiter((item['x'] for item in sorted_data), dtype=np.int64, count=count)
+        
+        if HAS_NUMBA:
+            bounds = _row_breaks(ys, y_tolerance).tolist() + [count]
+        else:
+            bounds = []
+            start = 0
+            while start < count:
+                # A row holds every element within y_tolerance below its first element
+                start = int(np.searchsorted(ys, ys[start] + y_tolerance, side='right'))
+                bounds.append(start)
+        
         rows = []
-        current_row = []
-        current_y = sorted_data[0]['y']
-        
-        for item in sorted_data:
-            if abs(item['y'] - current_y) <= y_tolerance:
-                # Same row
-                current_row.append(item)
-            else:
-                # New row
-                if current_row:
-                    # Sort current row by X coordinate and extract text
-                    row_text = [elem['text'] for elem in sorted(current_row, key=lambda x: x['x'])]
-                    rows.append(row_text)
-                current_row = [item]
-                current_y = item['y']
-        
-        # Don't forget the last row
-        if current_row:
-            row_text = [elem['text'] for elem in sorted(current_row, key=lambda x: x['x'])]
-            rows.append(row_text)
+        start = 0
+        for end in bounds:
+            # Sort the row by X coordinate and extract text
+            order = np.argsort(xs[start:end], kind='stable') + start
+            rows.append([sorted_data[i]['text'] for i in order])
+            start = end
         
         return rows
 
@@ -237,11 +415,35 @@ class OCRService:
         Determine if PDF is scanned (image-based) vs text-based
         """
         try:
+            if HAS_PYMUPDF:
+                with fitz.open(pdf_path) as doc:
+                    if doc.page_count > 0:
+                        # Structural fast path: the first page's resource lists answer the
+                        # clear-cut cases without decoding any content stream
+                        first_page = doc[0]
+                        verdict = self._classify_by_resources(
+                            has_fonts=bool(first_page.get_fonts()),
+                            has_images=bool(first_page.get_images())
+                        )
+                        if verdict is not None:
+                            return verdict
+                    
+                    pages_to_check = min(3, doc.page_count)
+                    text_length = sum(len(doc[i].get_text().strip()) for i in range(pages_to_check))
+                
+                avg_text_per_page = text_length / pages_to_check if pages_to_check > 0 else 0
+                return avg_text_per_page < 50
+            
             import pypdf
             
             with open(pdf_path, 'rb') as file:
                 pdf_reader = pypdf.PdfReader(file)
                 
+                if len(pdf_reader.pages) > 0:
+                    verdict = self._classify_by_resources(*self._page_resource_kinds(pdf_reader.pages[0]))
+                    if verdict is not None:
+                        return verdict
+                
                 # Check first few pages for extractable text
                 text_length = 0
                 pages_to_check = min(3, len(pdf_reader.pages))
@@ -260,4 +462,37 @@ class OCRService:
         except Exception as e:
             logger.warning(f"Could not determine PDF type: {e}")
             # Default to assuming it might be scanned
-            return True
\ No newline at end of file
+            return True
+
+    def _classify_by_resources(self, has_fonts: bool, has_images: bool) -> Optional[bool]:
+        """
+        Decide scanned vs text-based from a page's resources alone
+        
+        Returns True (scanned) for images without fonts, False (text-based) for fonts
+        without images, and None when both or neither are present.
+        """
+        if has_images and not has_fonts:
+            return True
+        if has_fonts and not has_images:
+            return False
+        return None
+
+    def _page_resource_kinds(self, page) -> tuple:
+        """Return (has_fonts, has_images) from a pypdf page's /Resources dictionary"""
+        resources = page.get('/Resources')
+        if resources is None:
+            return False, False
+        resources = resources.get_object()
+        
+        fonts = resources.get('/Font')
+        has_fonts = bool(fonts.get_object()) if fonts is not None else False
+        
+        has_images = False
+        xobjects = resources.get('/XObject')
+        if xobjects is not None:
+            for xobject in xobjects.get_object().values():
+                if xobject.get_object().get('/Subtype') == '/Image':
+                    has_images = True
+                    break
+        
+        return has_fonts, has_images
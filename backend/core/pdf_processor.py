@@ -4,17 +4,340 @@ Main business logic for extracting tables from PDFs
 """
 
 import pandas as pd
+import numpy as np
 import pdfplumber
 import camelot
 import tabula
 from typing import List, Dict, Any, Optional, Tuple
 from pathlib import Path
 import logging
+import os
+import re
+import asyncio
+import atexit
+import copy
+import hashlib
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import pypdfium2 as pdfium
+    import pypdfium2.raw as pdfium_c
+    HAS_PDFIUM = True
+except ImportError:
+    HAS_PDFIUM = False
+
 from security.validator import SecurePDFValidator
 from core.ocr_service import OCRService
 
 logger = logging.getLogger(__name__)
 
+# Numbers (optionally currency-prefixed) counted by the text heuristics
+_NUMBER_RE = re.compile(r'[\d,]+\.?\d*')
+_MONEY_RE = re.compile(r'\$?[\d,]+\.?\d*')
+# Column separators (tab, double space, pipe) and currency symbols in text lines
+_SEPARATOR_RE = re.compile(r'\t|  |\|')
+_CURRENCY_RE = re.compile(r'[$€£]')
+
+# Settings tried in order by the enhanced pdfplumber fallback; explicit
+# lines/lines is pdfplumber's default, so it is not listed separately
+ENHANCED_TABLE_SETTINGS = [
+    {},  # Default
+    {"vertical_strategy": "text", "horizontal_strategy": "text"},
+    {"intersection_tolerance": 5, "edge_min_length": 10}
+]
+_LINE_STRATEGIES = ('lines', 'lines_strict')
+
+
+def _needs_edges(settings: Dict[str, Any]) -> bool:
+    """Whether a table_settings dict builds cells from the page's drawn edges"""
+    return (settings.get('vertical_strategy', 'lines') in _LINE_STRATEGIES
+            or settings.get('horizontal_strategy', 'lines') in _LINE_STRATEGIES)
+
+
+def _page_ranges(page_count: int, parts: int) -> List[List[int]]:
+    """Split 1-based page numbers into at most `parts` contiguous ranges"""
+    size = -(-page_count // parts)
+    return [list(range(start, min(start + size, page_count + 1)))
+            for start in range(1, page_count + 1, size)]
+
+
+def _table_frame(table_data: List[List]) -> pd.DataFrame:
+    """
+    DataFrame from extracted rows, the first of which is the header
+    
+    The cells go through one object array instead of pandas' row-by-row list
+    conversion; pdfplumber cells are str or None, so the columns are object
+    dtype either way.
+    """
+    header, *rows = table_data
+    cells = np.array(rows, dtype=object)
+    if cells.ndim != 2 or cells.shape[1] != len(header):
+        # Ragged rows: let pandas pad them as before
+        return pd.DataFrame(rows, columns=header)
+    return pd.DataFrame(cells, columns=header, copy=False)
+
+
+def _trim_empty(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Drop all-empty rows and columns in one pass over a single null mask
+    
+    Same result as df.dropna(how='all').dropna(axis=1, how='all'): a column that
+    is empty once empty rows are gone was empty to begin with.
+    """
+    missing = df.isna().to_numpy()
+    if not missing.any():
+        return df  # The common case for camelot output
+    return df.iloc[~missing.all(axis=1), ~missing.all(axis=0)]
+
+
+def _table_confidence(df: pd.DataFrame) -> float:
+    """Enhanced confidence score calculation with multiple quality metrics"""
+    try:
+        total_cells = df.shape[0] * df.shape[1]
+        if total_cells == 0:
+            return 0.0
+        
+        # Base confidence from data completeness; the null mask is reused below
+        present = df.notna()
+        non_empty_cells = int(present.to_numpy().sum())
+        completeness = non_empty_cells / total_cells
+        
+        # Structure quality bonus
+        structure_score = 0.0
+        if df.shape[0] >= 3 and df.shape[1] >= 2:  # Minimum viable table
+            structure_score += 0.1
+        if df.shape[0] >= 5 and df.shape[1] >= 3:  # Well-formed table
+            structure_score += 0.05
+        
+        # Data variety bonus (avoid tables with too many duplicates)
+        try:
+            uniqueness = (len(df) - int(df.duplicated().sum())) / len(df) if len(df) > 0 else 0
+            variety_bonus = min(uniqueness * 0.08, 0.08)
+        except:
+            variety_bonus = 0
+        
+        # Numeric content bonus (tables often contain numbers)
+        numeric_bonus = 0.0
+        try:
+            numeric_cols = df.select_dtypes(include=['number']).shape[1]
+            if numeric_cols > 0:
+                numeric_bonus = min(numeric_cols / df.shape[1] * 0.05, 0.05)
+        except:
+            pass
+        
+        # Header detection bonus
+        header_bonus = 0.0
+        try:
+            # Check if first row looks like headers (mostly strings, low numeric content)
+            if not df.empty:
+                first_row = df.iloc[0]
+                string_count = int(first_row.map(lambda val: isinstance(val, str) and val != '').sum())
+                if string_count >= len(first_row) * 0.7:  # 70% string content
+                    header_bonus = 0.03
+        except:
+            pass
+        
+        # Column alignment bonus (consistent data types per column)
+        alignment_bonus = 0.0
+        try:
+            # Numeric, bool and datetime columns hold one value type by construction;
+            # only object-kind columns need their distinct types counted over non-null cells
+            consistent = present.any().to_numpy(copy=True)
+            is_object = np.array([dtype.kind == 'O' for dtype in df.dtypes], dtype=bool)
+            if is_object.any():
+                types_per_col = df.iloc[:, is_object].map(type).where(present.iloc[:, is_object]).nunique()
+                consistent[is_object] &= types_per_col.to_numpy() <= 2  # Allow some type variation
+            consistent_cols = int(consistent.sum())
+            alignment_bonus = min(consistent_cols / len(df.columns) * 0.04, 0.04)
+        except:
+            pass
+        
+        # Final confidence calculation
+        confidence = min(
+            completeness * 0.7 +  # 70% weight on completeness
+            structure_score + 
+            variety_bonus + 
+            numeric_bonus + 
+            header_bonus + 
+            alignment_bonus,
+            1.0
+        )
+        
+        return round(confidence, 3)
+        
+    except Exception:
+        return 0.5  # Default confidence
+
+
+# PDFium is not thread-safe; probes run from worker threads take turns
+_PDFIUM_LOCK = threading.Lock()
+
+
+def _pdfium_first_page(file_path: str) -> Optional[Tuple[str, bool]]:
+    """First-page text and whether it draws any vector paths, or None for an empty PDF"""
+    with _PDFIUM_LOCK:
+        pdf = pdfium.PdfDocument(file_path)
+        try:
+            if len(pdf) == 0:
+                return None
+            page = pdf[0]
+            textpage = page.get_textpage()
+            try:
+                text = textpage.get_text_range()
+                # Lines and rects are path objects, pdfplumber's rulings come from the same place
+                has_rulings = any(True for _ in page.get_objects(filter=(pdfium_c.FPDF_PAGEOBJ_PATH,)))
+            finally:
+                textpage.close()
+                page.close()
+            return text, has_rulings
+        finally:
+            pdf.close()
+
+
+def _release_page(page):
+    """Drop a pdfplumber page's parsed objects and text map (Page.close() in pdfplumber 0.11+)"""
+    page.flush_cache()
+    page.get_textmap.cache_clear()
+
+
+# Page workers run in separate processes (pdfminer is CPU-bound and pdfplumber is
+# not thread-safe), so they live at module level and open the PDF by path
+
+def _pdfplumber_page_tables(file_path: str, page_numbers: Optional[List[int]]) -> List[Tuple[int, List]]:
+    """Raw tables from the given 1-based pages (all pages if None), in page order"""
+    results = []
+    with pdfplumber.open(file_path, pages=page_numbers) as pdf:
+        for page in pdf.pages:
+            try:
+                results.append((page.page_number, page.extract_tables()))
+            except Exception as e:
+                logger.warning(f"pdfplumber failed on page {page.page_number - 1}: {str(e)}")
+            finally:
+                # Drop the page's parsed objects so memory stays flat across pages
+                _release_page(page)
+    return results
+
+
+def _enhanced_page_table(page, settings: Dict[str, Any]) -> Optional[Tuple[pd.DataFrame, float]]:
+    """First acceptable table on a page with one table_settings dict, or None"""
+    for table_data in page.extract_tables(table_settings=settings):
+        if table_data and len(table_data) > 1:
+            try:
+                df = _table_frame(table_data)
+                df = _trim_empty(df)
+                
+                if not df.empty and len(df) > 0:
+                    confidence = _table_confidence(df)
+                    if confidence >= 0.3:  # Lower threshold for fallback
+                        return df, confidence  # Found a good table with this setting
+            except Exception:
+                continue
+    return None
+
+
+def _enhanced_pdfplumber_page_tables(file_path: str, page_numbers: Optional[List[int]]) -> List[Tuple[int, Optional[Tuple], Optional[Tuple]]]:
+    """
+    Enhanced-fallback candidates per page: (page number, table found with the
+    default settings, table found with the remaining ENHANCED_TABLE_SETTINGS)
+    
+    Once a table has been found, later pages only get the default settings, so the
+    other settings are skipped after the first table in this worker's page range;
+    pages before the range are applied in the parent.
+    """
+    results = []
+    found_any = False
+    with pdfplumber.open(file_path, pages=page_numbers) as pdf:
+        for page in pdf.pages:
+            try:
+                default_found = _enhanced_page_table(page, ENHANCED_TABLE_SETTINGS[0])
+                other_found = None
+                if default_found is None and not found_any:
+                    # Without drawn edges the line-based settings cannot form any cell
+                    has_edges = bool(page.edges)
+                    for settings in ENHANCED_TABLE_SETTINGS[1:]:
+                        if not has_edges and _needs_edges(settings):
+                            continue
+                        other_found = _enhanced_page_table(page, settings)
+                        if other_found:  # If we found a table with this setting, don't try others
+                            break
+                found_any = found_any or bool(default_found or other_found)
+                results.append((page.page_number, default_found, other_found))
+                        
+            except Exception as e:
+                logger.warning(f"Enhanced pdfplumber failed on page {page.page_number - 1}: {str(e)}")
+                continue
+            finally:
+                _release_page(page)
+    return results
+
+
+def _camelot_tables(file_path: str, flavor: str = 'lattice') -> List[Tuple[pd.DataFrame, Optional[float]]]:
+    """
+    Camelot tables with their accuracy, trying `flavor` first and the other one if
+    it finds none (lattice suits ruled tables; stream skips Ghostscript rendering)
+    """
+    camelot_tables = camelot.read_pdf(file_path, flavor=flavor)
+    
+    if not camelot_tables:
+        # Fallback to the other method
+        camelot_tables = camelot.read_pdf(file_path, flavor='stream' if flavor == 'lattice' else 'lattice')
+    
+    # camelot Table objects don't pickle reliably; return the frames and scores
+    return [(table.df, getattr(table, 'accuracy', None)) for table in camelot_tables]
+
+
+def _warm_tabula_jvm():
+    """
+    Start tabula's JVM when the worker process comes up
+    
+    With JPype installed, tabula-py (2.8+) runs tabula-java inside the calling
+    process, so a long-lived worker pays the JVM start-up once instead of on every
+    read_pdf. The options match the ones tabula-py passes itself.
+    """
+    try:
+        from tabula.backend import TabulaVm
+        TabulaVm(java_options=["-Djava.awt.headless=true", "-Dfile.encoding=UTF8"], silent=True)
+    except Exception as e:
+        # Older tabula-py or no JPype: tabula starts a java subprocess per call
+        logger.warning(f"tabula JVM warm-up skipped: {e}")
+
+
+def _tabula_tables(file_path: str) -> List[pd.DataFrame]:
+    """All tables tabula finds in a PDF"""
+    return tabula.read_pdf(file_path, pages='all', multiple_tables=True)
+
+
+# Worker process pools shared by every extractor (callers may create one per
+# request), created on first use and shut down at interpreter exit
+_POOLS: Dict[str, ProcessPoolExecutor] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def _worker_pool(name: str, max_workers: int, initializer=None) -> ProcessPoolExecutor:
+    """The named worker pool, started on first use"""
+    with _POOLS_LOCK:
+        pool = _POOLS.get(name)
+        if pool is None:
+            # spawn rather than fork: forking a process with running threads is unsafe
+            pool = _POOLS[name] = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=initializer
+            )
+        return pool
+
+
+@atexit.register
+def _shutdown_worker_pools():
+    """Stop every worker pool without waiting on queued extractions"""
+    with _POOLS_LOCK:
+        for pool in _POOLS.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        _POOLS.clear()
+
 
 class TableExtractionResult:
     """Container for extraction results"""
@@ -31,51 +354,119 @@ class TableExtractionResult:
 class PDFTableExtractor:
     """Main PDF table extraction engine with enhanced optimization and OCR support"""
     
+    # Content hashes of PDFs that passed validation, most recently used last;
+    # shared across instances since callers may create an extractor per request
+    validated_cache_size = 512
+    _validated_digests: "OrderedDict[str, bool]" = OrderedDict()
+    # Scanned (image-only) verdict per PDF content hash
+    scanned_cache_size = 512
+    _scanned_cache: "OrderedDict[str, bool]" = OrderedDict()
+    # Method hint from pre-analysis per PDF content hash
+    method_cache_size = 128
+    _method_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+    # Successful results per (content hash, user tier); the tier matters because
+    # OCR is only attempted for paid tiers
+    result_cache_size = 128
+    _result_cache: "OrderedDict[Tuple[str, str], TableExtractionResult]" = OrderedDict()
+    
     def __init__(self):
         self.validator = SecurePDFValidator()
         self.ocr_service = OCRService()
         # Ordered by reliability and speed
         self.extraction_methods = ['pdfplumber', 'camelot', 'tabula']
         self.max_processing_time = 30  # 30 second timeout
+        self.max_analysis_time = 1.0  # Cap on method pre-analysis (5% of the time budget)
         self.confidence_threshold = 0.6  # Minimum confidence for valid extraction
+        # PDFs smaller or shorter than this skip pre-analysis and start with pdfplumber
+        self.selection_min_bytes = 256 * 1024
+        self.selection_min_pages = 3
+        # pdfplumber pages are split across worker processes, at least this many
+        # pages per worker; shorter documents are parsed in a thread instead
+        self.page_workers = min(os.cpu_count() or 1, 4)
+        self.min_pages_per_worker = 8
         
-    async def extract_tables(self, file_path: str, user_tier: str = 'free') -> TableExtractionResult:
+    async def extract_tables(self, file_path: str, user_tier: str = 'free',
+                             time_budget: Optional[float] = None) -> TableExtractionResult:
         """Extract tables from PDF using optimized multi-method approach"""
         import time
         import asyncio
         start_time = time.time()
+        if time_budget is None:
+            time_budget = self.max_processing_time
         
         result = TableExtractionResult()
         
         try:
-            # P0 Security: Validate PDF first
-            if not self.validator.validate_pdf_file(file_path):
-                result.errors.append("PDF validation failed")
+            # Content hash keys the validation, method and result caches below
+            digest = await asyncio.to_thread(self._file_digest, file_path)
+            
+            # P0 Security: Validate PDF first (validation is deterministic for the same bytes)
+            if digest not in self._validated_digests:
+                if not await asyncio.to_thread(self.validator.validate_pdf_file, file_path):
+                    result.errors.append("PDF validation failed")
+                    return result
+                self._validated_digests[digest] = True
+                while len(self._validated_digests) > self.validated_cache_size:
+                    self._validated_digests.popitem(last=False)
+            self._validated_digests.move_to_end(digest)
+            
+            # Identical uploads (client retries, re-submissions) reuse the earlier result
+            cache_key = (digest, user_tier)
+            cached = self._result_cache.get(cache_key)
+            if cached is not None:
+                self._result_cache.move_to_end(cache_key)
+                result = copy.deepcopy(cached)
+                result.processing_time = time.time() - start_time
+                logger.info(f"Extraction cache hit: {result.total_tables} tables")
                 return result
             
+            # Every stage opens the PDF itself (page workers run in other processes);
+            # the page count is read once, off the event loop
+            page_count = await asyncio.to_thread(self._page_count, file_path)
+            
+            # Paid tiers need the scanned verdict up front; the check runs
+            # while pre-analysis waits on its worker thread
+            scanned_task = None
+            if user_tier != 'free':
+                scanned_task = asyncio.create_task(self._is_scanned(file_path, digest))
+            
             # Quick pre-analysis to choose optimal method
-            optimal_method = await self._select_optimal_method(file_path)
+            method_hint = await self._choose_method(
+                file_path, page_count, digest,
+                analysis_budget=min(self.max_analysis_time, time_budget * 0.05)
+            )
+            optimal_method = method_hint['method']
+            
+            # Scanned PDFs have no text layer for the text-based methods to
+            # find, so paid users go straight to OCR
+            if scanned_task is not None and await scanned_task:
+                ocr_result = await self._extract_with_ocr(file_path, user_tier)
+                if ocr_result.tables:
+                    ocr_result.processing_time = time.time() - start_time
+                    self._cache_result(cache_key, ocr_result)
+                    return ocr_result
+                result.errors.extend(ocr_result.errors)
             
             # Try methods in optimized order
             methods_to_try = [optimal_method] + [m for m in self.extraction_methods if m != optimal_method]
             
             for method in methods_to_try:
                 # Check timeout
-                if time.time() - start_time > self.max_processing_time:
-                    result.errors.append(f"Processing timeout after {self.max_processing_time}s")
+                if time.time() - start_time > time_budget:
+                    result.errors.append(f"Processing timeout after {time_budget}s")
                     break
                 
                 try:
                     if method == 'pdfplumber':
-                        tables, confidence = await self._extract_with_pdfplumber(file_path)
+                        tables, confidence = await self._extract_with_pdfplumber(file_path, page_count)
                     elif method == 'camelot':
-                        tables, confidence = await self._extract_with_camelot(file_path)
+                        tables, confidence = await self._extract_with_camelot(file_path, method_hint['camelot_flavor'])
                     elif method == 'tabula':
                         tables, confidence = await self._extract_with_tabula(file_path)
                     
                     # Enhanced validation: check confidence threshold
                     if tables and confidence:
-                        avg_confidence = sum(confidence) / len(confidence)
+                        avg_confidence = float(np.mean(confidence))
                         if avg_confidence >= self.confidence_threshold:
                             result.tables = tables
                             result.confidence_scores = confidence
@@ -99,114 +490,110 @@ class PDFTableExtractor:
             
             # Apply fallback methods if primary methods failed
             if not result.tables:
-                fallback_result = await self._apply_fallback_methods(file_path)
+                fallback_result = await self._apply_fallback_methods(file_path, page_count)
                 if fallback_result.tables:
                     result = fallback_result
                     result.processing_time = time.time() - start_time
                 else:
-                    # OCR fallback for paid users if PDF might be scanned
-                    if user_tier != 'free':
-                        try:
-                            is_scanned = await self.ocr_service.is_scanned_pdf(file_path)
-                            if is_scanned:
-                                logger.info("Detected scanned PDF, attempting OCR extraction (paid feature)")
-                                ocr_result = await self.ocr_service.extract_tables_from_scanned_pdf(file_path, user_tier)
-                                
-                                if ocr_result.get('tables'):
-                                    # Convert OCR results to our format
-                                    result.tables = []
-                                    result.confidence_scores = []
-                                    
-                                    for ocr_table in ocr_result['tables']:
-                                        df = ocr_table.get('dataframe')
-                                        if df is not None and not df.empty:
-                                            result.tables.append(df)
-                                            result.confidence_scores.append(0.7)  # OCR confidence
-                                    
-                                    if result.tables:
-                                        result.extraction_method = "OCR_" + ocr_result.get('processing_method', 'tesseract')
-                                        result.total_tables = len(result.tables)
-                                        result.processing_time = time.time() - start_time
-                                        logger.info(f"OCR extraction successful: {len(result.tables)} tables found")
-                                        return result
-                        except Exception as e:
-                            logger.warning(f"OCR fallback failed: {str(e)}")
-                            result.errors.append(f"OCR processing failed: {str(e)}")
-                    else:
-                        # Suggest OCR upgrade for free users with scanned PDFs
-                        try:
-                            is_scanned = await self.ocr_service.is_scanned_pdf(file_path)
-                            if is_scanned:
-                                result.errors.append("This appears to be a scanned PDF. OCR processing is available for paid users to extract tables from scanned documents.")
-                        except:
-                            pass
+                    # Suggest OCR upgrade for free users with scanned PDFs
+                    # (paid users already had OCR tried above)
+                    if user_tier == 'free' and await self._is_scanned(file_path, digest):
+                        result.errors.append("This appears to be a scanned PDF. OCR processing is available for paid users to extract tables from scanned documents.")
                     
                     if not result.tables:
                         result.errors.append("No tables found with any extraction method (including fallbacks)")
             
+            if result.tables:
+                self._cache_result(cache_key, result)
             return result
-            
+        
         except Exception as e:
             logger.error(f"PDF extraction failed: {str(e)}")
             result.errors.append(f"Extraction failed: {str(e)}")
             result.processing_time = time.time() - start_time
             return result
     
-    async def _extract_with_pdfplumber(self, file_path: str) -> Tuple[List[pd.DataFrame], List[float]]:
+    def _get_page_pool(self) -> ProcessPoolExecutor:
+        """Worker processes for per-page pdfplumber extraction"""
+        return _worker_pool('pages', self.page_workers)
+    
+    def _get_camelot_pool(self) -> ProcessPoolExecutor:
+        """
+        Single camelot worker process
+        
+        Ghostscript keeps process-global state and crashes under concurrent use, so
+        camelot calls run one at a time, isolated from the API process and from the
+        pdfplumber workers.
+        """
+        return _worker_pool('camelot', 1)
+    
+    def _get_tabula_pool(self) -> ProcessPoolExecutor:
+        """Single tabula worker process, which keeps the JVM it starts as it comes up"""
+        return _worker_pool('tabula', 1, initializer=_warm_tabula_jvm)
+    
+    async def _run_on_pages(self, file_path: str, worker, page_count: int) -> list:
+        """Run a page worker over every page, one contiguous page range per worker process"""
+        workers = min(self.page_workers, page_count // self.min_pages_per_worker)
+        if workers <= 1:
+            # Not worth a process hop; still keep the parsing off the event loop
+            return await asyncio.to_thread(worker, file_path, None)
+        
+        loop = asyncio.get_running_loop()
+        pool = self._get_page_pool()
+        chunks = await asyncio.gather(*(
+            loop.run_in_executor(pool, worker, file_path, page_numbers)
+            for page_numbers in _page_ranges(page_count, workers)
+        ))
+        return [item for chunk in chunks for item in chunk]
+    
+    async def _extract_with_pdfplumber(self, file_path: str, page_count: int) -> Tuple[List[pd.DataFrame], List[float]]:
         """Extract tables using pdfplumber (most reliable for text-based PDFs)"""
         tables = []
         confidence_scores = []
         
-        with pdfplumber.open(file_path) as pdf:
-            for page_num, page in enumerate(pdf.pages):
-                try:
-                    # Extract tables from page
-                    page_tables = page.extract_tables()
-                    
-                    for table_data in page_tables:
-                        if table_data and len(table_data) > 1:  # At least header + 1 row
-                            # Convert to DataFrame
-                            df = pd.DataFrame(table_data[1:], columns=table_data[0])
-                            
-                            # Clean empty rows/columns
-                            df = df.dropna(how='all').dropna(axis=1, how='all')
+        # Pages are parsed in worker processes; DataFrames are built here
+        for page_number, page_tables in await self._run_on_pages(file_path, _pdfplumber_page_tables, page_count):
+            try:
+                for table_data in page_tables:
+                    if table_data and len(table_data) > 1:  # At least header + 1 row
+                        # Convert to DataFrame
+                        df = _table_frame(table_data)
+                        
+                        # Clean empty rows/columns
+                        df = _trim_empty(df)
+                        
+                        if not df.empty and len(df) > 0:
+                            tables.append(df)
+                            # Simple confidence based on data completeness
+                            confidence = self._calculate_confidence(df)
+                            confidence_scores.append(confidence)
                             
-                            if not df.empty and len(df) > 0:
-                                tables.append(df)
-                                # Simple confidence based on data completeness
-                                confidence = self._calculate_confidence(df)
-                                confidence_scores.append(confidence)
-                                
-                except Exception as e:
-                    logger.warning(f"pdfplumber failed on page {page_num}: {str(e)}")
-                    continue
+            except Exception as e:
+                logger.warning(f"pdfplumber failed on page {page_number - 1}: {str(e)}")
+                continue
         
         return tables, confidence_scores
     
-    async def _extract_with_camelot(self, file_path: str) -> Tuple[List[pd.DataFrame], List[float]]:
-        """Extract tables using Camelot (good for complex layouts)"""
+    async def _extract_with_camelot(self, file_path: str, flavor: Optional[str] = None) -> Tuple[List[pd.DataFrame], List[float]]:
+        """Extract tables using Camelot (good for complex layouts), starting with `flavor` if known"""
         tables = []
         confidence_scores = []
         
         try:
-            # Use lattice method for tables with clear borders
-            camelot_tables = camelot.read_pdf(file_path, flavor='lattice')
+            # Ghostscript (lattice rendering) is not thread-safe, so camelot runs in
+            # its own worker process rather than a thread
+            loop = asyncio.get_running_loop()
+            camelot_tables = await loop.run_in_executor(self._get_camelot_pool(), _camelot_tables, file_path, flavor or 'lattice')
             
-            if not camelot_tables:
-                # Fallback to stream method
-                camelot_tables = camelot.read_pdf(file_path, flavor='stream')
-            
-            for table in camelot_tables:
-                df = table.df
-                
+            for df, accuracy in camelot_tables:
                 if not df.empty and len(df) > 1:
                     # Clean the dataframe
-                    df = df.dropna(how='all').dropna(axis=1, how='all')
+                    df = _trim_empty(df)
                     
                     if not df.empty:
                         tables.append(df)
                         # Use Camelot's accuracy score
-                        confidence = table.accuracy / 100.0 if hasattr(table, 'accuracy') else 0.8
+                        confidence = accuracy / 100.0 if accuracy is not None else 0.8
                         confidence_scores.append(confidence)
                         
         except Exception as e:
@@ -220,13 +607,14 @@ class PDFTableExtractor:
         confidence_scores = []
         
         try:
-            # Extract all tables from PDF
-            tabula_tables = tabula.read_pdf(file_path, pages='all', multiple_tables=True)
+            # Extract all tables from PDF in the tabula worker, which reuses its JVM
+            loop = asyncio.get_running_loop()
+            tabula_tables = await loop.run_in_executor(self._get_tabula_pool(), _tabula_tables, file_path)
             
             for df in tabula_tables:
                 if not df.empty and len(df) > 1:
                     # Clean the dataframe
-                    df = df.dropna(how='all').dropna(axis=1, how='all')
+                    df = _trim_empty(df)
                     
                     if not df.empty:
                         tables.append(df)
@@ -240,123 +628,154 @@ class PDFTableExtractor:
     
     def _calculate_confidence(self, df: pd.DataFrame) -> float:
         """Enhanced confidence score calculation with multiple quality metrics"""
-        try:
-            total_cells = df.shape[0] * df.shape[1]
-            if total_cells == 0:
-                return 0.0
-            
-            # Base confidence from data completeness
-            non_empty_cells = df.count().sum()
-            completeness = non_empty_cells / total_cells
-            
-            # Structure quality bonus
-            structure_score = 0.0
-            if df.shape[0] >= 3 and df.shape[1] >= 2:  # Minimum viable table
-                structure_score += 0.1
-            if df.shape[0] >= 5 and df.shape[1] >= 3:  # Well-formed table
-                structure_score += 0.05
-            
-            # Data variety bonus (avoid tables with too many duplicates)
+        return _table_confidence(df)
+    
+    def _page_count(self, file_path: str) -> int:
+        """Number of pages in a PDF (blocking)"""
+        if HAS_PDFIUM:
+            with _PDFIUM_LOCK:
+                pdf = pdfium.PdfDocument(file_path)
+                try:
+                    return len(pdf)
+                finally:
+                    pdf.close()
+        with pdfplumber.open(file_path) as pdf:
+            return len(pdf.pages)
+    
+    def _file_digest(self, file_path: str) -> str:
+        """SHA-256 hex digest of a file's contents"""
+        with open(file_path, 'rb') as f:
+            return hashlib.file_digest(f, 'sha256').hexdigest()
+    
+    def _cache_result(self, cache_key: Tuple[str, str], result: TableExtractionResult):
+        """Store a copy of a successful result, evicting the least recently used"""
+        self._result_cache[cache_key] = copy.deepcopy(result)
+        self._result_cache.move_to_end(cache_key)
+        while len(self._result_cache) > self.result_cache_size:
+            self._result_cache.popitem(last=False)
+    
+    async def _is_scanned(self, file_path: str, digest: str) -> bool:
+        """Whether the PDF is image-only, checked once per content hash"""
+        is_scanned = self._scanned_cache.get(digest)
+        if is_scanned is None:
             try:
-                uniqueness = len(df.drop_duplicates()) / len(df) if len(df) > 0 else 0
-                variety_bonus = min(uniqueness * 0.08, 0.08)
-            except:
-                variety_bonus = 0
+                is_scanned = await self.ocr_service.is_scanned_pdf(file_path)
+            except Exception as e:
+                logger.warning(f"Scanned PDF check failed: {e}")
+                return False
+            self._scanned_cache[digest] = is_scanned
+            while len(self._scanned_cache) > self.scanned_cache_size:
+                self._scanned_cache.popitem(last=False)
+        self._scanned_cache.move_to_end(digest)
+        return is_scanned
+    
+    async def _extract_with_ocr(self, file_path: str, user_tier: str) -> TableExtractionResult:
+        """OCR extraction for scanned PDFs (paid feature)"""
+        result = TableExtractionResult()
+        try:
+            logger.info("Detected scanned PDF, attempting OCR extraction (paid feature)")
+            ocr_result = await self.ocr_service.extract_tables_from_scanned_pdf(file_path, user_tier)
             
-            # Numeric content bonus (tables often contain numbers)
-            numeric_bonus = 0.0
-            try:
-                numeric_cols = df.select_dtypes(include=['number']).shape[1]
-                if numeric_cols > 0:
-                    numeric_bonus = min(numeric_cols / df.shape[1] * 0.05, 0.05)
-            except:
-                pass
+            # Convert OCR results to our format
+            for ocr_table in ocr_result.get('tables') or []:
+                df = ocr_table.get('dataframe')
+                if df is not None and not df.empty:
+                    result.tables.append(df)
+                    result.confidence_scores.append(0.7)  # OCR confidence
             
-            # Header detection bonus
-            header_bonus = 0.0
+            if result.tables:
+                result.extraction_method = "OCR_" + ocr_result.get('processing_method', 'tesseract')
+                result.total_tables = len(result.tables)
+                logger.info(f"OCR extraction successful: {len(result.tables)} tables found")
+        except Exception as e:
+            logger.warning(f"OCR fallback failed: {str(e)}")
+            result.errors.append(f"OCR processing failed: {str(e)}")
+        return result
+    
+    def _method_hint(self, method: str, has_rulings: Optional[bool] = None) -> Dict[str, Any]:
+        """Pre-analysis outcome: the method to try first and, if rulings were checked, camelot's first flavor"""
+        return {
+            "method": method,
+            "has_rulings": has_rulings,
+            "camelot_flavor": None if has_rulings is None else ('lattice' if has_rulings else 'stream')
+        }
+    
+    async def _choose_method(self, file_path: str, page_count: int, digest: str, analysis_budget: float) -> Dict[str, Any]:
+        """
+        Method hint for extraction; pre-analysis is skipped for small PDFs, reused for repeat
+        uploads, and abandoned in favour of pdfplumber when it overruns analysis_budget
+        """
+        if (os.path.getsize(file_path) < self.selection_min_bytes
+                or page_count < self.selection_min_pages):
+            return self._method_hint('pdfplumber')
+        
+        hint = self._method_cache.get(digest)
+        if hint is None:
             try:
-                # Check if first row looks like headers (mostly strings, low numeric content)
-                if not df.empty:
-                    first_row = df.iloc[0]
-                    string_count = sum(isinstance(val, str) and len(str(val)) > 0 for val in first_row)
-                    if string_count >= len(first_row) * 0.7:  # 70% string content
-                        header_bonus = 0.03
-            except:
-                pass
+                # Runs in a thread, so an analysis that overruns is abandoned
+                # without holding up the event loop
+                hint = await asyncio.wait_for(
+                    asyncio.to_thread(self._analyze_pdf, file_path), timeout=analysis_budget
+                )
+            except asyncio.TimeoutError:
+                logger.info(f"Method selection exceeded {analysis_budget:.2f}s, defaulting to pdfplumber")
+                return self._method_hint('pdfplumber')
+            self._method_cache[digest] = hint
+            while len(self._method_cache) > self.method_cache_size:
+                self._method_cache.popitem(last=False)
+        self._method_cache.move_to_end(digest)
+        return hint
+    
+    def _analyze_pdf(self, file_path: str) -> Dict[str, Any]:
+        """Pick an extraction method from the first page's text and rulings (blocking)"""
+        try:
+            if HAS_PDFIUM:
+                # pdfium reads the first page in C, far cheaper than parsing it with pdfminer
+                probe = _pdfium_first_page(file_path)
+                if probe is None:
+                    return self._method_hint('pdfplumber')  # Default
+                page_text, has_rulings = probe
+            else:
+                with pdfplumber.open(file_path, pages=[1]) as pdf:
+                    if len(pdf.pages) == 0:
+                        return self._method_hint('pdfplumber')  # Default
+                    
+                    first_page = pdf.pages[0]
+                    
+                    # Check for explicit table structures
+                    page_text = first_page.extract_text() or ""
+                    # Ruling lines or cell borders mean camelot's lattice flavor can work;
+                    # without them it goes straight to stream
+                    has_rulings = bool(first_page.lines or first_page.rects)
             
-            # Column alignment bonus (consistent data types per column)
-            alignment_bonus = 0.0
-            try:
-                consistent_cols = 0
-                for col in df.columns:
-                    col_data = df[col].dropna()
-                    if len(col_data) > 0:
-                        # Check if column has consistent data type
-                        types = set(type(val).__name__ for val in col_data)
-                        if len(types) <= 2:  # Allow some type variation
-                            consistent_cols += 1
-                alignment_bonus = min(consistent_cols / len(df.columns) * 0.04, 0.04)
-            except:
-                pass
+            # If lots of tabular characters, prefer camelot for structured tables
+            tab_chars = page_text.count('\t') + page_text.count('|')
+            if tab_chars > 20:
+                logger.info("Detected structured table format, using camelot")
+                return self._method_hint('camelot', has_rulings)
             
-            # Final confidence calculation
-            confidence = min(
-                completeness * 0.7 +  # 70% weight on completeness
-                structure_score + 
-                variety_bonus + 
-                numeric_bonus + 
-                header_bonus + 
-                alignment_bonus,
-                1.0
-            )
+            # If lots of numeric data, tabula might be better
+            numbers = _MONEY_RE.findall(page_text)
+            if len(numbers) > 50:
+                logger.info("Detected numeric-heavy content, using tabula") 
+                return self._method_hint('tabula', has_rulings)
             
-            return round(confidence, 3)
+            # Default to pdfplumber for text-based tables
+            logger.info("Using default pdfplumber method")
+            return self._method_hint('pdfplumber', has_rulings)
             
-        except Exception:
-            return 0.5  # Default confidence
-    
-    async def _select_optimal_method(self, file_path: str) -> str:
-        """Quick analysis to select the best extraction method for this PDF"""
-        try:
-            # Quick PDF analysis using pdfplumber (fastest for analysis)
-            with pdfplumber.open(file_path) as pdf:
-                if len(pdf.pages) == 0:
-                    return 'pdfplumber'  # Default
-                
-                first_page = pdf.pages[0]
-                
-                # Check for explicit table structures
-                page_text = first_page.extract_text() or ""
-                
-                # If lots of tabular characters, prefer camelot for structured tables
-                tab_chars = page_text.count('\t') + page_text.count('|')
-                if tab_chars > 20:
-                    logger.info("Detected structured table format, using camelot")
-                    return 'camelot'
-                
-                # If lots of numeric data, tabula might be better
-                import re
-                numbers = re.findall(r'\$?[\d,]+\.?\d*', page_text)
-                if len(numbers) > 50:
-                    logger.info("Detected numeric-heavy content, using tabula") 
-                    return 'tabula'
-                
-                # Default to pdfplumber for text-based tables
-                logger.info("Using default pdfplumber method")
-                return 'pdfplumber'
-                
         except Exception as e:
             logger.warning(f"Method selection failed: {e}, defaulting to pdfplumber")
-            return 'pdfplumber'
+            return self._method_hint('pdfplumber')
     
-    async def _apply_fallback_methods(self, file_path: str) -> TableExtractionResult:
+    async def _apply_fallback_methods(self, file_path: str, page_count: int) -> TableExtractionResult:
         """Apply fallback extraction methods for difficult PDFs"""
         result = TableExtractionResult()
         
         try:
             # Fallback 1: Try pdfplumber with different extraction settings
             logger.info("Applying fallback method 1: Enhanced pdfplumber")
-            tables, confidence = await self._extract_with_enhanced_pdfplumber(file_path)
+            tables, confidence = await self._extract_with_enhanced_pdfplumber(file_path, page_count)
             if tables and confidence:
                 result.tables = tables
                 result.confidence_scores = confidence
@@ -366,7 +785,7 @@ class PDFTableExtractor:
             
             # Fallback 2: Try to extract as raw text and parse manually
             logger.info("Applying fallback method 2: Text parsing")
-            tables, confidence = await self._extract_via_text_parsing(file_path)
+            tables, confidence = await asyncio.to_thread(self._extract_via_text_parsing, file_path)
             if tables and confidence:
                 result.tables = tables
                 result.confidence_scores = confidence
@@ -380,55 +799,28 @@ class PDFTableExtractor:
         
         return result
     
-    async def _extract_with_enhanced_pdfplumber(self, file_path: str) -> Tuple[List[pd.DataFrame], List[float]]:
+    async def _extract_with_enhanced_pdfplumber(self, file_path: str, page_count: int) -> Tuple[List[pd.DataFrame], List[float]]:
         """Enhanced pdfplumber extraction with more aggressive table detection"""
         tables = []
         confidence_scores = []
         
         try:
-            with pdfplumber.open(file_path) as pdf:
-                for page_num, page in enumerate(pdf.pages):
-                    try:
-                        # Try with different table extraction settings
-                        table_settings = [
-                            {},  # Default
-                            {"vertical_strategy": "lines", "horizontal_strategy": "lines"},
-                            {"vertical_strategy": "text", "horizontal_strategy": "text"},
-                            {"intersection_tolerance": 5, "edge_min_length": 10}
-                        ]
-                        
-                        for settings in table_settings:
-                            page_tables = page.extract_tables(table_settings=settings)
-                            
-                            for table_data in page_tables:
-                                if table_data and len(table_data) > 1:
-                                    try:
-                                        df = pd.DataFrame(table_data[1:], columns=table_data[0])
-                                        df = df.dropna(how='all').dropna(axis=1, how='all')
-                                        
-                                        if not df.empty and len(df) > 0:
-                                            confidence = self._calculate_confidence(df)
-                                            if confidence >= 0.3:  # Lower threshold for fallback
-                                                tables.append(df)
-                                                confidence_scores.append(confidence)
-                                                break  # Found a good table with this setting
-                                    except Exception:
-                                        continue
-                            
-                            if tables:  # If we found tables with this setting, don't try others
-                                break
-                                
-                    except Exception as e:
-                        logger.warning(f"Enhanced pdfplumber failed on page {page_num}: {str(e)}")
-                        continue
-                        
+            # Pages are searched in worker processes; in page order, the first page
+            # with a table may use any settings, later pages only the default
+            for _, default_found, other_found in await self._run_on_pages(file_path, _enhanced_pdfplumber_page_tables, page_count):
+                found = default_found or (None if tables else other_found)
+                if found:
+                    df, confidence = found
+                    tables.append(df)
+                    confidence_scores.append(confidence)
+            
         except Exception as e:
             logger.error(f"Enhanced pdfplumber extraction failed: {str(e)}")
         
         return tables, confidence_scores
     
-    async def _extract_via_text_parsing(self, file_path: str) -> Tuple[List[pd.DataFrame], List[float]]:
-        """Last resort: extract text and try to parse tabular data manually"""
+    def _extract_via_text_parsing(self, file_path: str) -> Tuple[List[pd.DataFrame], List[float]]:
+        """Last resort: extract text and try to parse tabular data manually (blocking)"""
         tables = []
         confidence_scores = []
         
@@ -442,12 +834,7 @@ class PDFTableExtractor:
                         
                         # Look for patterns that suggest tabular data
                         lines = text.split('\n')
-                        table_lines = []
-                        
-                        for line in lines:
-                            # Detect lines that might be table rows
-                            if self._looks_like_table_row(line):
-                                table_lines.append(line)
+                        table_lines = self._select_table_lines(lines)
                         
                         if len(table_lines) >= 3:  # At least header + 2 data rows
                             df = self._parse_text_table(table_lines)
@@ -459,45 +846,48 @@ class PDFTableExtractor:
                     except Exception as e:
                         logger.warning(f"Text parsing failed: {str(e)}")
                         continue
-                        
+                    finally:
+                        # Release the page's cached layout so memory stays flat across pages
+                        _release_page(page)
+                    
         except Exception as e:
             logger.error(f"Text parsing extraction failed: {str(e)}")
         
         return tables, confidence_scores
     
-    def _looks_like_table_row(self, line: str) -> bool:
-        """Heuristic to detect if a text line looks like a table row"""
-        import re
+    def _select_table_lines(self, lines: List[str]) -> List[str]:
+        """Heuristic to detect which text lines look like table rows, for all lines at once"""
+        text_lines = pd.Series(lines, dtype=object)
         
         # Count numbers, currency symbols, and separators
-        numbers = len(re.findall(r'[\d,]+\.?\d*', line))
-        separators = line.count('\t') + line.count('  ') + line.count('|')
-        currency = line.count('$') + line.count('€') + line.count('£')
+        numbers = text_lines.str.count(_NUMBER_RE)
+        separators = text_lines.str.count(_SEPARATOR_RE)
+        currency = text_lines.str.count(_CURRENCY_RE)
         
         # If line has multiple numbers or clear separators, it might be tabular
-        return (numbers >= 2 or separators >= 2 or currency >= 1) and len(line.strip()) > 10
+        mask = ((numbers >= 2) | (separators >= 2) | (currency >= 1)) & (text_lines.str.strip().str.len() > 10)
+        return text_lines[mask].tolist()
     
     def _parse_text_table(self, lines: List[str]) -> Optional[pd.DataFrame]:
         """Parse lines of text into a DataFrame"""
         try:
-            import re
-            
-            # Try to detect the separator pattern
+            # Try to detect the separator pattern. A line splits into one more
+            # column than it has separators, so the separator with the most
+            # occurrences overall gives the most columns on average; counting
+            # over the joined text (no separator contains a newline) replaces a
+            # split of every line per candidate
             separators = ['\t', '  ', '   ', '|', ',']
-            best_separator = None
-            max_columns = 0
-            
-            for sep in separators:
-                avg_cols = sum(len(line.split(sep)) for line in lines) / len(lines)
-                if avg_cols > max_columns:
-                    max_columns = avg_cols
-                    best_separator = sep
+            text = '\n'.join(lines)
+            separator_counts = [text.count(sep) for sep in separators]
+            best_count = max(separator_counts)
+            best_separator = separators[separator_counts.index(best_count)]  # first wins ties
+            max_columns = (best_count + len(lines)) / len(lines)
             
             if best_separator and max_columns >= 2:
-                # Parse the table
+                # Parse the table, splitting each line once with the chosen separator
                 parsed_data = []
                 for line in lines:
-                    row = [cell.strip() for cell in line.split(best_separator) if cell.strip()]
+                    row = [cell for cell in map(str.strip, line.split(best_separator)) if cell]
                     if row:
                         parsed_data.append(row)
                 
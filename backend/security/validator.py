@@ -83,8 +83,10 @@ class SecurePDFValidator:
     
     def generate_file_hash(self, file_path: str) -> str:
         """Generate SHA256 hash for file integrity"""
-        sha256_hash = hashlib.sha256()
         with open(file_path, "rb") as f:
-            for byte_block in iter(lambda: f.read(4096), b""):
+            if hasattr(hashlib, 'file_digest'):
+                return hashlib.file_digest(f, 'sha256').hexdigest()
+            sha256_hash = hashlib.sha256()
+            for byte_block in iter(lambda: f.read(1024 * 1024), b""):
                 sha256_hash.update(byte_block)
         return sha256_hash.hexdigest()
\ No newline at end of file